@@ -0,0 +1,52 @@
+"""add ingest jobs table
+
+Revision ID: 3c1f9a7d2b64
+Revises: 5bf146fc3d97
+Create Date: 2026-10-17 09:12:31.402115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f9a7d2b64'
+down_revision: Union[str, None] = '5bf146fc3d97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'ingest_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.String(), nullable=True),
+        sa.Column('kind', sa.String(), nullable=True),
+        sa.Column('filename', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('stage', sa.String(), nullable=True),
+        sa.Column('chunks_total', sa.Integer(), nullable=True),
+        sa.Column('chunks_embedded', sa.Integer(), nullable=True),
+        sa.Column('chunks_upserted', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('document_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ingest_jobs_id'), 'ingest_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_ingest_jobs_job_id'), 'ingest_jobs', ['job_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ingest_jobs_job_id'), table_name='ingest_jobs')
+    op.drop_index(op.f('ix_ingest_jobs_id'), table_name='ingest_jobs')
+    op.drop_table('ingest_jobs')
@@ -0,0 +1,46 @@
+"""add transcripts table
+
+Revision ID: 6b2d8f4e1a37
+Revises: 9d4e2b7a1c85
+Create Date: 2026-10-17 14:22:41.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b2d8f4e1a37'
+down_revision: Union[str, None] = '9d4e2b7a1c85'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'transcripts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('audio_hash', sa.String(length=64), nullable=True),
+        sa.Column('params', sa.String(), nullable=True),
+        sa.Column('segments', sa.Text(), nullable=True),
+        sa.Column('segment_count', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('audio_hash', 'params', name='uq_transcripts_audio_hash_params')
+    )
+    op.create_index(op.f('ix_transcripts_id'), 'transcripts', ['id'], unique=False)
+    op.create_index(op.f('ix_transcripts_audio_hash'), 'transcripts', ['audio_hash'], unique=False)
+    op.add_column('documents', sa.Column('transcript_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_documents_transcript_id', 'documents', 'transcripts', ['transcript_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_documents_transcript_id', 'documents', type_='foreignkey')
+    op.drop_column('documents', 'transcript_id')
+    op.drop_index(op.f('ix_transcripts_audio_hash'), table_name='transcripts')
+    op.drop_index(op.f('ix_transcripts_id'), table_name='transcripts')
+    op.drop_table('transcripts')
@@ -0,0 +1,34 @@
+"""add content and media fields to document chunks
+
+Revision ID: b7c3e5a90d14
+Revises: e4a91c7d3f28
+Create Date: 2026-10-17 18:41:37.102948
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c3e5a90d14'
+down_revision: Union[str, None] = 'e4a91c7d3f28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('document_chunks', sa.Column('content', sa.LargeBinary(), nullable=True))
+    op.add_column('document_chunks', sa.Column('start_time', sa.Float(), nullable=True))
+    op.add_column('document_chunks', sa.Column('end_time', sa.Float(), nullable=True))
+    op.add_column('document_chunks', sa.Column('segments', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('document_chunks', 'segments')
+    op.drop_column('document_chunks', 'end_time')
+    op.drop_column('document_chunks', 'start_time')
+    op.drop_column('document_chunks', 'content')
@@ -0,0 +1,28 @@
+"""add routing_indexed to documents
+
+Revision ID: e4a91c7d3f28
+Revises: 6b2d8f4e1a37
+Create Date: 2026-10-17 16:05:12.774203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a91c7d3f28'
+down_revision: Union[str, None] = '6b2d8f4e1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('routing_indexed', sa.Boolean(), nullable=True, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'routing_indexed')
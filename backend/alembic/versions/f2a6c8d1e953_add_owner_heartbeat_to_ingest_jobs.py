@@ -0,0 +1,32 @@
+"""add owner and heartbeat to ingest jobs
+
+Revision ID: f2a6c8d1e953
+Revises: b7c3e5a90d14
+Create Date: 2026-10-17 21:12:05.418230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6c8d1e953'
+down_revision: Union[str, None] = 'b7c3e5a90d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ingest_jobs', sa.Column('owner', sa.String(), nullable=True))
+    op.add_column('ingest_jobs', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_ingest_jobs_owner'), 'ingest_jobs', ['owner'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ingest_jobs_owner'), table_name='ingest_jobs')
+    op.drop_column('ingest_jobs', 'heartbeat_at')
+    op.drop_column('ingest_jobs', 'owner')
@@ -0,0 +1,161 @@
+# answer_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Callable, List, Optional
+
+from embedding_cache import normalize_query
+
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "./answer_cache.sqlite3")
+# Cosine similarity a new question needs with a cached one to reuse its answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_PER_SCOPE = int(os.getenv("ANSWER_CACHE_MAX_PER_SCOPE", "200"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(7 * 86400)))
+
+
+def answer_scope(kind: str, user_id: int, documents: list) -> str:
+    """
+    Cache scope for one endpoint, user and set of documents.
+    Each document's updated_at is part of it, so re-ingesting a document
+    moves its questions to a new, empty scope.
+    """
+    versions = ",".join(
+        f"{doc.id}@{doc.updated_at.isoformat() if doc.updated_at else ''}"
+        for doc in sorted(documents, key=lambda d: d.id)
+    )
+    return f"{kind}:{user_id}:{hashlib.sha256(versions.encode('utf-8')).hexdigest()}"
+
+
+class AnswerCache:
+    """
+    Generated answers, reused for questions that mean the same thing.
+
+    Entries live in a SQLite file (WAL mode, shared by the workers on one
+    host), grouped by scope (see answer_scope). A question that matches a
+    cached one word for word, ignoring case and spacing, is a hit without
+    being embedded. Otherwise it is a hit when its embedding is within
+    `threshold` cosine similarity of a cached question in the same scope.
+    Each scope keeps its `max_per_scope` most recently used entries, and
+    entries older than `ttl_seconds` are dropped.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 max_per_scope: int = ANSWER_CACHE_MAX_PER_SCOPE, ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS):
+        self.path = path
+        self.threshold = threshold
+        self.max_per_scope = max_per_scope
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS answers (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   scope TEXT NOT NULL,
+                   question TEXT NOT NULL,
+                   vector BLOB NOT NULL,
+                   payload TEXT NOT NULL,
+                   created_at REAL NOT NULL,
+                   last_used REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_answers_scope ON answers (scope, last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_answers_created_at ON answers (created_at)")
+        self._conn.commit()
+
+    def lookup(self, scope: str, question: str, embed: Callable[[str], List[float]]):
+        """
+        Returns (payload, None) on a hit and (None, question vector) on a miss;
+        the vector is what store() expects. `embed` is only called when no
+        cached question matches exactly.
+        """
+        payload = self.lookup_exact(scope, question)
+        if payload is not None:
+            return payload, None
+        embedded = embed(question)
+        return self.lookup_similar(scope, embedded), embedded
+
+    def lookup_exact(self, scope: str, question: str) -> Optional[dict]:
+        """The payload cached for this question word for word, if any. A miss isn't counted."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, payload FROM answers WHERE scope = ? AND question = ? AND created_at > ?",
+                (scope, normalize_query(question), time.time() - self.ttl_seconds)
+            ).fetchone()
+        return self._hit(row[0], row[1]) if row is not None else None
+
+    def lookup_similar(self, scope: str, embedded: List[float]) -> Optional[dict]:
+        """The payload of the closest cached question within the threshold, if any."""
+        import numpy as np
+
+        vector = np.asarray(embedded, dtype=np.float32)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, vector FROM answers WHERE scope = ? AND created_at > ? AND length(vector) > 0",
+                (scope, time.time() - self.ttl_seconds)
+            ).fetchall()
+        if rows:
+            matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+            norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+            norms[norms == 0] = 1.0
+            scores = matrix @ vector / norms
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                with self._lock:
+                    payload = self._conn.execute(
+                        "SELECT payload FROM answers WHERE id = ?", (rows[best][0],)
+                    ).fetchone()
+                if payload is not None:
+                    return self._hit(rows[best][0], payload[0])
+        self.miss()
+        return None
+
+    def miss(self):
+        """Count a lookup that found nothing, for callers that stop after lookup_exact."""
+        with self._lock:
+            self.misses += 1
+
+    def _hit(self, entry_id: int, payload: str) -> dict:
+        with self._lock:
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(payload)
+
+    def store(self, scope: str, question: str, vector: Optional[List[float]], payload: dict):
+        """Cache an answer. Without a vector the entry is only found by lookup_exact."""
+        blob = array("f", vector).tobytes() if vector is not None else b""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (scope, question, vector, payload, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, normalize_query(question), blob, json.dumps(payload, default=str), now, now)
+            )
+            self._conn.execute(
+                """DELETE FROM answers WHERE scope = ? AND id NOT IN (
+                       SELECT id FROM answers WHERE scope = ? ORDER BY last_used DESC LIMIT ?
+                   )""",
+                (scope, scope, self.max_per_scope)
+            )
+            self._conn.execute("DELETE FROM answers WHERE created_at <= ?", (now - self.ttl_seconds,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "threshold": self.threshold,
+        }
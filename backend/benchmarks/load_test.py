@@ -0,0 +1,104 @@
+# load_test.py
+"""
+Concurrent-request load test against a running API worker.
+
+Sends --requests requests to one endpoint, --concurrency at a time, and
+meanwhile probes `/` every --probe-interval seconds. A worker whose event
+loop is blocked by a provider call answers the probe only after that call
+returns, so probe latency shows event-loop stalls directly, and request
+throughput shows whether concurrent requests overlap or are serialized.
+
+Run it against one uvicorn worker, before and after a change:
+
+    uvicorn main:app --workers 1
+    python benchmarks/load_test.py --token $TOKEN --path /api/query/ \\
+        --json '{"document_id": 1, "question": "What is the warranty period?"}'
+    python benchmarks/load_test.py --token $TOKEN --path /api/summarize/ --form document_id=1
+
+Repeated questions may be answered from the answer cache; start the server
+with ANSWER_CACHE_ENABLED=false to measure full generation.
+"""
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def build_request(args) -> urllib.request.Request:
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    if args.json:
+        data = args.json.encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    else:
+        data = urllib.parse.urlencode(dict(field.split("=", 1) for field in args.form)).encode("utf-8")
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    return urllib.request.Request(args.base_url + args.path, data=data, headers=headers, method="POST")
+
+
+def timed(request, timeout):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            ok = 200 <= response.status < 300
+    except (urllib.error.URLError, TimeoutError):
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def probe(args, stop: threading.Event, latencies: list):
+    while not stop.is_set():
+        latency, ok = timed(urllib.request.Request(args.base_url + "/"), args.timeout)
+        if ok:
+            latencies.append(latency)
+        stop.wait(args.probe_interval)
+
+
+def run(args):
+    request = build_request(args)
+    probe_latencies = []
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(args, stop, probe_latencies), daemon=True)
+    prober.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda _: timed(request, args.timeout), range(args.requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    prober.join()
+
+    latencies = [latency for latency, ok in results if ok]
+    failures = sum(1 for _, ok in results if not ok)
+    print(f"{args.path}: {args.requests} requests, {args.concurrency} concurrent, {failures} failed")
+    print(f"  wall time   {elapsed:8.2f} s   throughput {len(latencies) / elapsed:6.2f} req/s")
+    print(f"  latency     p50 {percentile(latencies, 50):6.2f} s   p95 {percentile(latencies, 95):6.2f} s")
+    print(
+        f"  probe /     p50 {percentile(probe_latencies, 50) * 1000:6.0f} ms  "
+        f"p95 {percentile(probe_latencies, 95) * 1000:6.0f} ms  "
+        f"max {max(probe_latencies, default=0) * 1000:6.0f} ms  ({len(probe_latencies)} probes)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", help="bearer token from /api/auth/login")
+    parser.add_argument("--path", default="/api/query/")
+    parser.add_argument("--json", help="JSON request body")
+    parser.add_argument("--form", nargs="*", default=[], help="form fields as key=value")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--probe-interval", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=120)
+    run(parser.parse_args())
@@ -0,0 +1,99 @@
+# vector_store_benchmark.py
+"""
+Recall and latency of the local vector store across embedding dimensions and
+storage dtypes.
+
+Every configuration is compared with exact search over full 3072-dim float32
+vectors. Without --vectors, synthetic embeddings are generated whose variance
+decays along the dimensions, like a Matryoshka-trained model where the
+leading components carry most of the signal. For real numbers, save
+document embeddings (full dimension, one per row) with numpy.save and pass
+the file.
+
+    python benchmarks/vector_store_benchmark.py
+    python benchmarks/vector_store_benchmark.py --vectors chunks.npy --dims 3072 1536 768 --dtypes float32 int8
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import FULL_EMBEDDING_DIM  # noqa: E402
+from vector_store import LocalVectorStore, _normalize  # noqa: E402
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int, rng) -> np.ndarray:
+    decay = 1.0 / np.sqrt(1.0 + np.arange(dimension) / 64.0)
+    centers = rng.normal(size=(clusters, dimension)) * decay
+    labels = rng.integers(0, clusters, size=count)
+    return (centers[labels] + 0.6 * rng.normal(size=(count, dimension)) * decay).astype(np.float32)
+
+
+def truncate(vectors: np.ndarray, dimension: int) -> np.ndarray:
+    return _normalize(vectors[:, :dimension])
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    if args.vectors:
+        data = np.load(args.vectors).astype(np.float32)
+    else:
+        data = synthetic_vectors(args.count + args.queries, FULL_EMBEDDING_DIM, args.clusters, rng)
+    rng.shuffle(data)
+    corpus, queries = data[args.queries:], data[:args.queries]
+
+    # Ground truth: exact search at full dimension and precision
+    full_corpus = _normalize(corpus)
+    truth = [set(np.argsort(-(full_corpus @ q))[:args.top_k].tolist()) for q in _normalize(queries)]
+
+    print(f"{len(corpus)} vectors, {len(queries)} queries, recall@{args.top_k} vs exact {data.shape[1]}-dim float32\n")
+    print(f"{'dim':>6} {'dtype':>8} {'recall':>8} {'p50 ms':>8} {'p95 ms':>8} {'disk MB':>9}")
+
+    for dimension in args.dims:
+        corpus_d = truncate(corpus, dimension)
+        queries_d = truncate(queries, dimension)
+        for dtype in args.dtypes:
+            with tempfile.TemporaryDirectory() as path:
+                store = LocalVectorStore(path, dimension=dimension, dtype=dtype)
+                for start in range(0, len(corpus_d), 1000):
+                    store.upsert([
+                        {"id": str(i), "values": corpus_d[i]}
+                        for i in range(start, min(start + 1000, len(corpus_d)))
+                    ], "bench")
+                # Warm up the memory map before timing
+                store.query(queries_d[0], args.top_k, "bench", include_metadata=False)
+
+                latencies = []
+                hits = 0
+                for q, expected in zip(queries_d, truth):
+                    started = time.perf_counter()
+                    result = store.query(q, args.top_k, "bench", include_metadata=False)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    hits += len(expected & {int(m["id"]) for m in result["matches"]})
+
+                # Vector bytes per row: the float32 row, plus the compact copy
+                # (and its float32 scale, for int8) that quantized stores scan
+                row_bytes = 4 * dimension + {"float32": 0, "float16": 2 * dimension, "int8": dimension + 4}[dtype]
+                disk_mb = len(corpus_d) * row_bytes / (1024 * 1024)
+                print(
+                    f"{dimension:>6} {dtype:>8} {hits / (len(queries_d) * args.top_k):>8.3f} "
+                    f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f} {disk_mb:>9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", help=".npy file of full-dimension embeddings (one per row)")
+    parser.add_argument("--count", type=int, default=20000, help="synthetic corpus size")
+    parser.add_argument("--clusters", type=int, default=200, help="synthetic topic clusters")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--dims", type=int, nargs="+", default=[3072, 1536, 768, 256])
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "float16", "int8"])
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
@@ -0,0 +1,190 @@
+# chunk_store.py
+import os
+import json
+import zlib
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+import models
+
+
+# Chunk text lives in document_chunks (zlib-compressed), not in vector
+# metadata: vectors carry only ids and small fields (document_id,
+# chunk_index, page, start/end), and the text for the hits a query
+# actually uses is read back in one query.
+
+# Context expansion: each retrieved chunk is widened with up to
+# CONTEXT_EXPAND_RADIUS neighbours on either side, as long as the whole
+# context stays within CONTEXT_EXPAND_CHARS characters.
+CONTEXT_EXPAND_RADIUS = int(os.getenv("CONTEXT_EXPAND_RADIUS", "1"))
+CONTEXT_EXPAND_CHARS = int(os.getenv("CONTEXT_EXPAND_CHARS", "5000"))
+
+# Shorter suffix/prefix matches between PDF chunks are taken as coincidence
+_MIN_TEXT_OVERLAP = 16
+
+
+def pack_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"))
+
+
+def unpack_text(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8")
+
+
+def fetch_chunks(db: Session, vector_ids: List[str]) -> Dict[str, models.DocumentChunk]:
+    """Chunk rows by vector id, in one round-trip per 1000 ids."""
+    rows = {}
+    for i in range(0, len(vector_ids), 1000):
+        batch = vector_ids[i:i + 1000]
+        for row in db.query(models.DocumentChunk).filter(models.DocumentChunk.vector_id.in_(batch)):
+            rows[row.vector_id] = row
+    return rows
+
+
+def chunk_metadata(row: models.DocumentChunk) -> dict:
+    """A chunk row in the shape of vector metadata, text included."""
+    meta = {
+        "document_id": row.document_id,
+        "chunk_index": row.chunk_index,
+        "text": unpack_text(row.content) if row.content is not None else "",
+    }
+    if row.page is not None:
+        meta["page"] = row.page
+    if row.start_time is not None:
+        meta["segment_index"] = row.chunk_index
+        meta["start"] = row.start_time
+        meta["end"] = row.end_time
+    if row.segments:
+        meta["segments"] = row.segments
+    return meta
+
+
+def hydrate_matches(db: Session, matches: List[dict]) -> List[dict]:
+    """
+    Fill in text (and segment boundaries) for vector matches from the chunk
+    store. Vectors indexed before the chunk store still carry their text in
+    metadata and are left as they are.
+    """
+    missing = [m["id"] for m in matches if "text" not in m["metadata"]]
+    if not missing:
+        return matches
+    rows = fetch_chunks(db, missing)
+    for match in matches:
+        row = rows.get(match["id"])
+        if "text" not in match["metadata"]:
+            if row is None:
+                match["metadata"]["text"] = ""
+            else:
+                match["metadata"] = {**match["metadata"], **chunk_metadata(row)}
+    return matches
+
+
+def fetch_by_index(db: Session, document_id: int, chunk_indices: List[int]) -> Dict[int, dict]:
+    """Chunk metadata (with text) for one document's chunk indices."""
+    rows = db.query(models.DocumentChunk).filter(
+        models.DocumentChunk.document_id == document_id,
+        models.DocumentChunk.chunk_index.in_(chunk_indices)
+    ).all()
+    return {row.chunk_index: chunk_metadata(row) for row in rows if row.content is not None}
+
+
+def as_chunk_index(value):
+    """
+    A chunk index from vector metadata as an int, or None. Pinecone returns
+    every metadata number as a float, so 3.0 is chunk 3.
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else None
+
+
+def _chunk_key(meta: dict):
+    return as_chunk_index(meta.get("chunk_index", meta.get("segment_index")))
+
+
+def _join_text(text: str, following: str) -> str:
+    """Append a chunk that may repeat the end of `text` (the splitter's overlap)."""
+    for k in range(min(len(text), len(following)), _MIN_TEXT_OVERLAP - 1, -1):
+        if text.endswith(following[:k]):
+            return text + following[k:]
+    return text + "\n" + following
+
+
+def _join_window(span: dict, window: dict) -> str:
+    """Append a transcript window, skipping the segments already covered by `span`."""
+    for start, _, offset in json.loads(window["segments"]):
+        if start >= span["end"]:
+            return span["text"] + " " + window["text"][offset:]
+    return span["text"]
+
+
+def _merge_run(run: List[dict]) -> dict:
+    span = dict(run[0])
+    for meta in run[1:]:
+        if "segments" in span and "segments" in meta:
+            span["text"] = _join_window(span, meta)
+            span["end"] = max(span["end"], meta["end"])
+        else:
+            span["text"] = _join_text(span["text"], meta["text"])
+    return span
+
+
+def expand_context(db: Session, document_id: int, hits: List[dict],
+                   radius: int = CONTEXT_EXPAND_RADIUS, budget: int = CONTEXT_EXPAND_CHARS) -> List[dict]:
+    """
+    Widen retrieved chunks (metadata dicts with text, best first) with their
+    neighbours by chunk_index, which for media is the order of transcript
+    windows in time. Neighbours come from the chunk store in one query.
+
+    Adjacent and overlapping chunks are merged into spans shaped like chunk
+    metadata, plus `chunk_indices`; the span holding the best hit comes
+    first. The hits themselves are always kept; neighbours are added nearest
+    first, in hit order, while the total stays within `budget` characters.
+    """
+    keys = [_chunk_key(hit) for hit in hits]
+    wanted = {
+        key + d for key in keys if key is not None
+        for d in range(-radius, radius + 1) if key + d >= 0
+    }
+    chunks = fetch_by_index(db, document_id, sorted(wanted)) if wanted and radius > 0 else {}
+    for hit, key in zip(hits, keys):
+        if key is not None:
+            chunks.setdefault(key, hit)
+
+    selected = {key for key in keys if key is not None}
+    used = sum(len(chunks[key]["text"]) for key in selected)
+    for distance in range(1, radius + 1):
+        for key in keys:
+            if key is None:
+                continue
+            for neighbour, nearer in ((key - distance, key - distance + 1), (key + distance, key + distance - 1)):
+                if neighbour in selected or neighbour not in chunks or nearer not in selected:
+                    continue
+                size = len(chunks[neighbour]["text"])
+                if used + size <= budget:
+                    selected.add(neighbour)
+                    used += size
+
+    rank = {}
+    for position, key in enumerate(keys):
+        if key is not None:
+            rank.setdefault(key, position)
+    runs = []
+    for key in sorted(selected):
+        if runs and runs[-1][-1] == key - 1:
+            runs[-1].append(key)
+        else:
+            runs.append([key])
+    runs.sort(key=lambda run: min(rank.get(key, len(keys)) for key in run))
+
+    spans = []
+    for run in runs:
+        span = _merge_run([chunks[key] for key in run])
+        span["chunk_indices"] = run
+        spans.append(span)
+    # Hits without a chunk index (vectors indexed long ago) are passed through
+    spans.extend(hit for hit, key in zip(hits, keys) if key is None)
+    return spans
@@ -0,0 +1,238 @@
+# embedding_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List
+
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./embedding_cache.sqlite3")
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "1024"))
+
+# Question embeddings: an in-process LRU with a TTL, keyed by model and the
+# normalised question. QUERY_EMBED_CACHE_PATH adds a SQLite file that every
+# worker on the host reads and writes, so a question embedded by one worker
+# is a hit in the others.
+QUERY_EMBED_CACHE_ENABLED = os.getenv("QUERY_EMBED_CACHE_ENABLED", "true").lower() == "true"
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+QUERY_EMBED_CACHE_TTL_SECONDS = int(os.getenv("QUERY_EMBED_CACHE_TTL_SECONDS", "86400"))
+QUERY_EMBED_CACHE_PATH = os.getenv("QUERY_EMBED_CACHE_PATH", "")
+
+
+def chunk_hash(text: str) -> str:
+    """Stable content hash of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _cache_key(model: str, text: str) -> str:
+    return f"{model}:{chunk_hash(text)}"
+
+
+def _pack(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> list:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding store.
+
+    Keyed by (model, sha256 of the text), so re-uploading the same or a
+    lightly edited document only embeds chunks that have never been seen.
+    Vectors are stored as float32 blobs in SQLite (WAL mode, safe to share
+    between uvicorn workers on one host). When the stored vectors exceed
+    `max_bytes`, least recently used entries are evicted down to 90%.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_bytes: int = EMBED_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   key TEXT PRIMARY KEY,
+                   vector BLOB NOT NULL,
+                   size INTEGER NOT NULL,
+                   last_used REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, list]:
+        """Return {position: vector} for every text already in the cache."""
+        keys = [_cache_key(model, t) for t in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, k) for k in found]
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return {i: _unpack(found[k]) for i, k in enumerate(keys) if k in found}
+
+    def put_many(self, model: str, texts: List[str], vectors: List[list]):
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = _pack(vector)
+            rows.append((_cache_key(model, text), blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used"):
+            if total - freed <= target:
+                break
+            doomed.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self._conn.commit()
+        print(f"Embedding cache evicted {len(doomed)} entries ({freed} bytes)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a question, for cache keys."""
+    return " ".join(text.casefold().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Recently embedded questions, so a repeated question, a session follow-up
+    or a `/timestamps/` topic asked again skips the embedding round-trip.
+
+    Entries expire `ttl_seconds` after they are written; past `max_entries`
+    the least recently used entry is dropped. With `path`, entries are also
+    written to a SQLite file, and misses in this process are looked up there.
+    """
+
+    def __init__(self, max_entries: int = QUERY_EMBED_CACHE_SIZE,
+                 ttl_seconds: int = QUERY_EMBED_CACHE_TTL_SECONDS, path: str = QUERY_EMBED_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, vector)
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS query_embeddings (
+                       key TEXT PRIMARY KEY,
+                       vector BLOB NOT NULL,
+                       expires_at REAL NOT NULL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_query_embeddings_expires_at ON query_embeddings (expires_at)")
+            self._conn.commit()
+
+    def get(self, model: str, text: str):
+        """The cached vector for a question, or None."""
+        key = _cache_key(model, normalize_query(text))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT vector, expires_at FROM query_embeddings WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    vector = _unpack(row[0])
+                    self._remember(key, row[1], vector)
+                    self.hits += 1
+                    return vector
+            self.misses += 1
+        return None
+
+    def put(self, model: str, text: str, vector: list):
+        key = _cache_key(model, normalize_query(text))
+        now = time.time()
+        with self._lock:
+            self._remember(key, now + self.ttl_seconds, list(vector))
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, vector, expires_at) VALUES (?, ?, ?)",
+                    (key, _pack(vector), now + self.ttl_seconds)
+                )
+                self._conn.execute("DELETE FROM query_embeddings WHERE expires_at <= ?", (now,))
+                self._conn.commit()
+
+    def _remember(self, key: str, expires_at: float, vector: list):
+        self._entries[key] = (expires_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "shared": self._conn is not None,
+        }
@@ -0,0 +1,265 @@
+# embeddings.py
+import os
+import math
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+FULL_EMBEDDING_DIM = 3072
+# gemini-embedding-001 is Matryoshka-trained: a prefix of the vector is itself
+# a usable embedding. Stored and query vectors are cut to EMBEDDING_DIM
+# (e.g. 768) and re-normalised; the embedding cache keeps the full vectors.
+EMBEDDING_DIM = min(int(os.getenv("EMBEDDING_DIM", str(FULL_EMBEDDING_DIM))), FULL_EMBEDDING_DIM)
+
+# Gemini's batchEmbedContents accepts at most 100 inputs per request.
+EMBED_BATCH_SIZE = min(int(os.getenv("EMBED_BATCH_SIZE", "100")), 100)
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+# How long the coalescer waits for more texts before sending a partial batch.
+EMBED_LINGER_MS = int(os.getenv("EMBED_LINGER_MS", "50"))
+
+# Errors that mean "this request is bad as sent" — retrying the same batch
+# won't help, but splitting it might isolate the offending input.
+_NON_RETRYABLE_CODES = {400, 413}
+
+
+def _is_payload_error(e: Exception) -> bool:
+    """Whether the request was rejected for its contents (bad or oversized input)."""
+    return getattr(e, "code", getattr(e, "status_code", None)) in _NON_RETRYABLE_CODES
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+def truncate_embedding(vector: list, dimension: int = EMBEDDING_DIM) -> list:
+    """First `dimension` components of a vector, scaled back to unit length."""
+    if len(vector) <= dimension:
+        return list(vector)
+    head = vector[:dimension]
+    norm = math.sqrt(sum(x * x for x in head)) or 1.0
+    return [x / norm for x in head]
+
+
+class BatchEmbedder:
+    """
+    Embeds many texts with few round-trips.
+
+    Texts are grouped into batches of up to `batch_size` per request and up to
+    `concurrency` batches are in flight at once. Results come back in input
+    order. A failing batch is retried with backoff. A batch the API rejects
+    as bad or too large is split in half instead, down to the single bad
+    input, which comes back as None so it doesn't sink the rest of the
+    document.
+    """
+
+    def __init__(self, client, model: str = EMBEDDING_MODEL, batch_size: int = EMBED_BATCH_SIZE,
+                 concurrency: int = EMBED_CONCURRENCY, max_retries: int = EMBED_MAX_RETRIES,
+                 cache=None, dimension: int = EMBEDDING_DIM, query_cache=None):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.query_cache = query_cache
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+
+    def embed(self, texts: List[str], progress=None) -> List[Optional[list]]:
+        """
+        One vector per text, in order. A text the API rejects on its own
+        (malformed, too long) gets None instead, so the rest still embed.
+        """
+        return [
+            truncate_embedding(v, self.dimension) if v is not None else None
+            for v in self._embed_full(texts, progress)
+        ]
+
+    def embed_query(self, text: str) -> list:
+        """
+        Embed a single question directly, skipping batching and the chunk
+        cache. Questions seen recently come from the query cache instead.
+        """
+        # Query vectors are cached already truncated, so the dimension is part of the key
+        model = f"{self.model}:{self.dimension}"
+        if self.query_cache is not None:
+            vector = self.query_cache.get(model, text)
+            if vector is not None:
+                return vector
+        vector = truncate_embedding(self._request_with_retry([text])[0], self.dimension)
+        if self.query_cache is not None:
+            self.query_cache.put(model, text, vector)
+        return vector
+
+    def _embed_full(self, texts: List[str], progress=None) -> List[list]:
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_uncached(texts, progress)
+
+        # Only chunks the cache has never seen cost an API call.
+        cached = self.cache.get_many(self.model, texts)
+        if progress and cached:
+            progress.embedded(len(cached))
+
+        missing = [i for i in range(len(texts)) if i not in cached]
+        missing_texts = [texts[i] for i in missing]
+        fresh = self._embed_uncached(missing_texts, progress)
+        embedded = [(text, vector) for text, vector in zip(missing_texts, fresh) if vector is not None]
+        if embedded:
+            self.cache.put_many(self.model, [t for t, _ in embedded], [v for _, v in embedded])
+
+        embeddings = [None] * len(texts)
+        for i, vector in cached.items():
+            embeddings[i] = vector
+        for i, vector in zip(missing, fresh):
+            embeddings[i] = vector
+        return embeddings
+
+    def _embed_uncached(self, texts: List[str], progress=None) -> List[list]:
+        if not texts:
+            return []
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        futures = [self._executor.submit(self._embed_batch, batch, progress) for batch in batches]
+
+        embeddings = []
+        for future in futures:
+            embeddings.extend(future.result())
+        return embeddings
+
+    def _embed_batch(self, texts: List[str], progress=None) -> List[list]:
+        try:
+            vectors = self._request_with_retry(texts)
+        except Exception as e:
+            # Rate limits and server errors have already been retried; splitting
+            # would only multiply the requests. Only a rejected payload is split.
+            if not _is_payload_error(e):
+                raise
+            if len(texts) == 1:
+                print(f"Skipping a chunk the embedding API rejected: {str(e)}")
+                return [None]
+            mid = len(texts) // 2
+            print(f"Embedding batch of {len(texts)} failed ({str(e)}), splitting")
+            return self._embed_batch(texts[:mid], progress) + self._embed_batch(texts[mid:], progress)
+
+        if progress:
+            progress.embedded(len(texts))
+        return vectors
+
+    def _request_with_retry(self, texts: List[str]) -> List[list]:
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = self.client.models.embed_content(model=self.model, contents=texts)
+                vectors = [e.values for e in result.embeddings]
+                if len(vectors) != len(texts):
+                    raise EmbeddingError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception as e:
+                if _is_payload_error(e) or attempt == self.max_retries:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+
+
+class CoalescingEmbedder(BatchEmbedder):
+    """
+    BatchEmbedder that merges concurrent embed() calls into shared batches.
+
+    Many small documents ingested at once (bulk uploads) each produce a
+    handful of chunks; instead of one short request per document, their
+    texts are pooled by a dispatcher thread into full `batch_size` requests.
+    A batch is sent when full or after `linger_ms`, whichever comes first.
+    """
+
+    def __init__(self, client, linger_ms: int = EMBED_LINGER_MS, **kwargs):
+        super().__init__(client, **kwargs)
+        self.linger = linger_ms / 1000
+        self._queue = queue.Queue()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="embed-coalescer", daemon=True)
+        self._dispatcher.start()
+
+    def _embed_uncached(self, texts: List[str], progress=None) -> List[list]:
+        if not texts:
+            return []
+        # One shared token per call so failures can be isolated per caller
+        owner = object()
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((owner, text, future, progress))
+            futures.append(future)
+        return [f.result() for f in futures]
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            vectors = self._request_with_retry([text for _, text, _, _ in batch])
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self._resolve(batch, vectors)
+
+    def _fail(self, batch, error: Exception):
+        """
+        Settle a batch whose request failed without re-sending it whole.
+        A rejected payload is narrowed down to the caller, then the chunk,
+        that caused it, which resolves to None; any other error goes to
+        every caller in the batch, each as its own exception.
+        """
+        owners = {}
+        for item in batch:
+            owners.setdefault(id(item[0]), []).append(item)
+        groups = list(owners.values())
+        if _is_payload_error(error):
+            if len(groups) > 1:
+                half = len(groups) // 2
+                self._run([item for items in groups[:half] for item in items])
+                self._run([item for items in groups[half:] for item in items])
+                return
+            texts = [text for _, text, _, _ in batch]
+            if len(texts) == 1:
+                print(f"Skipping a chunk the embedding API rejected: {str(error)}")
+                self._resolve(batch, [None])
+                return
+            mid = len(texts) // 2
+            try:
+                self._resolve(batch, self._embed_batch(texts[:mid]) + self._embed_batch(texts[mid:]))
+                return
+            except Exception as e:
+                error = e
+        for items in groups:
+            message = str(error) if isinstance(error, EmbeddingError) else f"Failed to embed chunks: {str(error)}"
+            failure = EmbeddingError(message)
+            failure.__cause__ = error
+            for _, _, future, _ in items:
+                future.set_exception(failure)
+
+    def _resolve(self, items, vectors):
+        reporters = {}
+        counts = {}
+        for (_, _, future, progress), vector in zip(items, vectors):
+            future.set_result(vector)
+            if progress and vector is not None:
+                reporters[id(progress)] = progress
+                counts[id(progress)] = counts.get(id(progress), 0) + 1
+        for key, progress in reporters.items():
+            progress.embedded(counts[key])
@@ -0,0 +1,256 @@
+# jobs.py
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+from database import SessionLocal
+import models
+
+
+# Bounded pool for ingestion pipelines. Jobs beyond the workers wait in a
+# queue of INGEST_QUEUE_SIZE; anything past that is rejected with 503 so a
+# burst of uploads can't pile up unbounded work on one API process.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))
+# Each API process stamps its queued/running jobs every
+# INGEST_HEARTBEAT_INTERVAL seconds and, on the same tick, fails other
+# processes' jobs whose heartbeat is older than INGEST_HEARTBEAT_TIMEOUT:
+# their owner died, and its in-memory payload with it.
+INGEST_HEARTBEAT_INTERVAL = int(os.getenv("INGEST_HEARTBEAT_INTERVAL", "30"))
+INGEST_HEARTBEAT_TIMEOUT = int(os.getenv("INGEST_HEARTBEAT_TIMEOUT", "120"))
+
+# Identifies this process as the owner of the jobs it creates
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_slots = threading.BoundedSemaphore(INGEST_WORKERS + INGEST_QUEUE_SIZE)
+
+# Bulk uploads get their own pool: BULK_INGEST_WORKERS is the global limit on
+# bulk files ingesting at once, across all requests, and up to
+# BULK_QUEUE_SIZE spooled files may wait for it.
+BULK_INGEST_WORKERS = int(os.getenv("BULK_INGEST_WORKERS", "4"))
+BULK_QUEUE_SIZE = int(os.getenv("BULK_QUEUE_SIZE", "1000"))
+
+_bulk_executor = ThreadPoolExecutor(max_workers=BULK_INGEST_WORKERS, thread_name_prefix="bulk-ingest")
+_bulk_slots = threading.BoundedSemaphore(BULK_INGEST_WORKERS + BULK_QUEUE_SIZE)
+
+
+def create_job(db, user_id: int, kind: str, filename: str) -> models.IngestJob:
+    """Insert a queued job row and return it."""
+    job = models.IngestJob(
+        job_id=str(uuid.uuid4()),
+        kind=kind,
+        filename=filename,
+        status="queued",
+        stage="queued",
+        user_id=user_id,
+        owner=WORKER_ID,
+        heartbeat_at=datetime.now(timezone.utc)
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def update_job(job_id: str, **fields):
+    """Update a job row from a worker thread (uses its own DB session)."""
+    db = SessionLocal()
+    try:
+        job = db.query(models.IngestJob).filter(models.IngestJob.job_id == job_id).first()
+        if not job:
+            return
+        for key, value in fields.items():
+            setattr(job, key, value)
+        db.commit()
+    finally:
+        db.close()
+
+
+class JobProgress:
+    """
+    Progress reporter handed to pipeline stages.
+    Counter updates are throttled so embedding thousands of chunks
+    doesn't turn into thousands of DB writes.
+    """
+
+    def __init__(self, job_id: str, min_interval: float = 1.0):
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.chunks_upserted = 0
+        # Chunks left out because the embedding API rejected them; reported in the result
+        self.chunks_failed = 0
+
+    def stage(self, name: str, **fields):
+        update_job(self.job_id, stage=name, **fields)
+
+    def set_document(self, document_id: int):
+        update_job(self.job_id, document_id=document_id)
+
+    def set_total(self, total: int):
+        with self._lock:
+            self.chunks_total = total
+        self.flush(force=True)
+
+    def add_total(self, count: int):
+        with self._lock:
+            self.chunks_total += count
+        self.flush(force=True)
+
+    def embedded(self, count: int):
+        with self._lock:
+            self.chunks_embedded += count
+        self.flush()
+
+    def failed(self, count: int):
+        with self._lock:
+            self.chunks_failed += count
+
+    def upserted(self, count: int):
+        with self._lock:
+            self.chunks_upserted += count
+        self.flush()
+
+    def flush(self, force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_flush < self.min_interval:
+                return
+            self._last_flush = now
+            fields = {
+                "chunks_total": self.chunks_total,
+                "chunks_embedded": self.chunks_embedded,
+                "chunks_upserted": self.chunks_upserted,
+            }
+        update_job(self.job_id, **fields)
+
+
+def _run_job(job_id: str, pipeline, args: tuple, slots):
+    progress = JobProgress(job_id)
+    try:
+        update_job(job_id, status="running")
+        result = pipeline(progress, *args)
+        progress.flush(force=True)
+        update_job(job_id, status="completed", stage="completed", result=json.dumps(result, default=str))
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f"Ingest job {job_id} failed: {detail}")
+        progress.flush(force=True)
+        update_job(job_id, status="failed", error=str(detail))
+    finally:
+        slots.release()
+
+
+def submit_job(job_id: str, pipeline, *args):
+    """
+    Schedule pipeline(progress, *args) on the ingest pool.
+    Raises 503 when the pool and its queue are full.
+    """
+    if not _slots.acquire(blocking=False):
+        update_job(job_id, status="failed", error="Ingestion queue is full")
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, try again shortly")
+    _executor.submit(_run_job, job_id, pipeline, args, _slots)
+
+
+def submit_bulk_job(job_id: str, pipeline, *args):
+    """Like submit_job, but on the shared bulk pool."""
+    if not _bulk_slots.acquire(blocking=False):
+        update_job(job_id, status="failed", error="Bulk ingestion queue is full")
+        raise HTTPException(status_code=503, detail="Bulk ingestion queue is full, try again shortly")
+    _bulk_executor.submit(_run_job, job_id, pipeline, args, _bulk_slots)
+
+
+def send_heartbeat():
+    """Stamp this process's queued/running jobs as still alive."""
+    db = SessionLocal()
+    try:
+        db.query(models.IngestJob).filter(
+            models.IngestJob.owner == WORKER_ID,
+            models.IngestJob.status.in_(["queued", "running"])
+        ).update({models.IngestJob.heartbeat_at: datetime.now(timezone.utc)}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def recover_interrupted_jobs():
+    """
+    Mark queued/running jobs whose owner stopped sending heartbeats as failed.
+    Their in-memory payload is gone, so they can't be resumed. Jobs from
+    before heartbeats were recorded are judged by their last update.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=INGEST_HEARTBEAT_TIMEOUT)
+    db = SessionLocal()
+    try:
+        stale = db.query(models.IngestJob).filter(
+            models.IngestJob.status.in_(["queued", "running"]),
+            or_(models.IngestJob.owner.is_(None), models.IngestJob.owner != WORKER_ID),
+            or_(
+                models.IngestJob.heartbeat_at < cutoff,
+                and_(models.IngestJob.heartbeat_at.is_(None), models.IngestJob.updated_at < cutoff)
+            )
+        ).all()
+        for job in stale:
+            job.status = "failed"
+            job.error = "Interrupted by server restart, please upload again"
+        db.commit()
+        if stale:
+            print(f"Marked {len(stale)} interrupted ingest job(s) as failed")
+    finally:
+        db.close()
+
+
+_heartbeat_stop = threading.Event()
+
+
+def _heartbeat_loop():
+    while True:
+        try:
+            send_heartbeat()
+            recover_interrupted_jobs()
+        except Exception as e:
+            print(f"Ingest job heartbeat failed: {e}")
+        if _heartbeat_stop.wait(INGEST_HEARTBEAT_INTERVAL):
+            return
+
+
+def start_job_heartbeat():
+    """Start the background thread that heartbeats and sweeps ingest jobs."""
+    _heartbeat_stop.clear()
+    threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+
+def stop_job_heartbeat():
+    _heartbeat_stop.set()
+
+
+def job_to_dict(job: models.IngestJob) -> dict:
+    return {
+        "job_id": job.job_id,
+        "kind": job.kind,
+        "filename": job.filename,
+        "status": job.status,
+        "stage": job.stage,
+        "progress": {
+            "chunks_total": job.chunks_total or 0,
+            "chunks_embedded": job.chunks_embedded or 0,
+            "chunks_upserted": job.chunks_upserted or 0,
+        },
+        "document_id": job.document_id,
+        "error": job.error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
@@ -0,0 +1,165 @@
+# lexical_index.py
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, List
+
+
+LEXICAL_ENABLED = os.getenv("LEXICAL_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index.sqlite3")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Reciprocal-rank fusion constant: score = sum(1 / (RRF_K + rank))
+RRF_K = 60
+
+# Words joined by -, _, ., / or : (part numbers, error codes, versions) are
+# kept whole as well as split, so "ERR-4012" matches exactly and by parts.
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:[-_./:][0-9a-z]+)*")
+_QUOTED_RE = re.compile(r'"([^"]+)"')
+# Shorter unquoted tokens ("v2", "3.5") are too common to be looked up literally
+EXACT_TERM_MIN_LENGTH = 4
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(re.split(r"[-_./:]", token))
+    return tokens
+
+
+def _is_code_like(token: str) -> bool:
+    """Part numbers, error codes, identifiers: not plain words, numbers or years."""
+    if len(token) < EXACT_TERM_MIN_LENGTH:
+        return False
+    if re.search(r"[_./:]", token):
+        return True
+    # Letters mixed with digits, e.g. ERR-4012 or x86; hyphenated words don't count
+    return bool(re.search(r"[a-z]", token)) and bool(re.search(r"[0-9]", token))
+
+
+def exact_terms(question: str) -> List[str]:
+    """
+    Terms a question wants matched literally: quoted phrases' tokens and
+    code-like tokens.
+    """
+    terms = [t for phrase in _QUOTED_RE.findall(question) for t in _TOKEN_RE.findall(phrase.lower())]
+    for token in _TOKEN_RE.findall(question.lower()):
+        if _is_code_like(token) and token not in terms:
+            terms.append(token)
+    return terms
+
+
+def reciprocal_rank_fusion(*rankings: List[int], k: int = RRF_K) -> List[int]:
+    """Merge ranked lists of keys; keys ranked high in any list come first."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class LexicalIndex:
+    """
+    Per-document BM25 inverted index of chunk text, in a local SQLite file.
+
+    Chunks are keyed by (document_id, chunk_index), the same indices the
+    vector store and the chunk store use, so lexical and vector hits can be
+    fused by index and their text read back from the chunk store.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                   document_id INTEGER NOT NULL,
+                   chunk_index INTEGER NOT NULL,
+                   length INTEGER NOT NULL,
+                   page INTEGER,
+                   PRIMARY KEY (document_id, chunk_index)
+               )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS postings (
+                   document_id INTEGER NOT NULL,
+                   term TEXT NOT NULL,
+                   chunk_index INTEGER NOT NULL,
+                   tf INTEGER NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_postings_term ON postings (document_id, term)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_postings_chunk ON postings (document_id, chunk_index)")
+        self._conn.commit()
+
+    def add_chunks(self, document_id: int, indexed_chunks: List[tuple]):
+        """Index (chunk_index, {text, page}) pairs, replacing any earlier version of them."""
+        chunk_rows = []
+        posting_rows = []
+        for i, chunk in indexed_chunks:
+            counts = Counter(tokenize(chunk["text"]))
+            chunk_rows.append((document_id, i, sum(counts.values()), chunk.get("page")))
+            posting_rows.extend((document_id, term, i, tf) for term, tf in counts.items())
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM postings WHERE document_id = ? AND chunk_index = ?",
+                [(document_id, i) for i, _ in indexed_chunks]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (document_id, chunk_index, length, page) VALUES (?, ?, ?, ?)",
+                chunk_rows
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (document_id, term, chunk_index, tf) VALUES (?, ?, ?, ?)",
+                posting_rows
+            )
+            self._conn.commit()
+
+    def truncate(self, document_id: int, count: int):
+        """Drop chunks at index `count` and beyond (the document got shorter)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM postings WHERE document_id = ? AND chunk_index >= ?", (document_id, count))
+            self._conn.execute("DELETE FROM chunks WHERE document_id = ? AND chunk_index >= ?", (document_id, count))
+            self._conn.commit()
+
+    def delete_document(self, document_id: int):
+        self.truncate(document_id, 0)
+
+    def search(self, document_id: int, query: str, top_k: int) -> List[dict]:
+        """BM25-ranked chunks: [{chunk_index, score, terms}], best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        with self._lock:
+            chunk_count, avg_length = self._conn.execute(
+                "SELECT COUNT(*), AVG(length) FROM chunks WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            if not chunk_count:
+                return []
+            postings = self._conn.execute(
+                f"""SELECT p.term, p.chunk_index, p.tf, c.length FROM postings p
+                    JOIN chunks c ON c.document_id = p.document_id AND c.chunk_index = p.chunk_index
+                    WHERE p.document_id = ? AND p.term IN ({placeholders})""",
+                [document_id, *terms]
+            ).fetchall()
+
+        df = Counter(term for term, _, _, _ in postings)
+        scores: Dict[int, float] = {}
+        matched: Dict[int, set] = {}
+        for term, i, tf, length in postings:
+            idf = math.log(1 + (chunk_count - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+            scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+            matched.setdefault(i, set()).add(term)
+
+        best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return [{"chunk_index": i, "score": scores[i], "terms": matched[i]} for i in best]
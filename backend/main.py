@@ -1,26 +1,44 @@
 # main.py
+import os
+import threading
+from contextlib import asynccontextmanager
+
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import cloudinary
-import os
 from dotenv import load_dotenv
 
 from database import engine, Base, SessionLocal
 from models import User, Document, Query, Session as DbSession
-from router import router
+from router import router, warm_fixed_queries
 from auth_router import auth_router
+from jobs import start_job_heartbeat, stop_job_heartbeat
 
 load_dotenv()
 
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
+# Tables are normally created by `python provision.py` (or Alembic);
+# DB_CREATE_ALL=true restores creating them on every start.
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "false").lower() == "true"
+
+# Routes are plain functions, run on anyio's thread pool so a slow Groq,
+# Gemini, Pinecone or database call only ties up its own thread. This is how
+# many can run at once per worker (anyio's default is 40).
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "64"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    if DB_CREATE_ALL:
+        Base.metadata.create_all(bind=engine)
+    # Off the start-up path, so the worker serves requests straight away
+    start_job_heartbeat()
+    threading.Thread(target=warm_fixed_queries, name="warm-queries", daemon=True).start()
+    yield
+    stop_job_heartbeat()
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="PDF Question Answering API")
+app = FastAPI(title="PDF Question Answering API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
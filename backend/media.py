@@ -0,0 +1,322 @@
+# media.py
+import os
+import re
+import json
+import subprocess
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+
+# Long recordings are cut into overlapping windows and transcribed in
+# parallel. Each window is a separate Whisper request, so it also stays well
+# under the provider's upload size limit.
+TRANSCRIBE_WINDOW_SECONDS = float(os.getenv("TRANSCRIBE_WINDOW_SECONDS", "600"))
+TRANSCRIBE_OVERLAP_SECONDS = float(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "10"))
+FFMPEG_TIMEOUT_SECONDS = int(os.getenv("FFMPEG_TIMEOUT_SECONDS", "600"))
+
+# Voice-activity pre-pass: stretches quieter than VAD_NOISE_DB for at least
+# VAD_MIN_SILENCE_SECONDS are cut before transcription, keeping
+# VAD_PADDING_SECONDS either side of speech so word edges aren't clipped.
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"
+VAD_NOISE_DB = int(os.getenv("VAD_NOISE_DB", "-35"))
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "0.8"))
+VAD_PADDING_SECONDS = float(os.getenv("VAD_PADDING_SECONDS", "0.2"))
+VAD_MIN_SAVINGS = float(os.getenv("VAD_MIN_SAVINGS", "0.05"))
+
+# Whisper segments are merged into retrieval chunks of at most
+# MEDIA_CHUNK_TOKENS (estimated) and MEDIA_CHUNK_SECONDS, each starting
+# MEDIA_CHUNK_OVERLAP_SECONDS before the previous one ended.
+MEDIA_CHUNK_TOKENS = int(os.getenv("MEDIA_CHUNK_TOKENS", "200"))
+MEDIA_CHUNK_SECONDS = float(os.getenv("MEDIA_CHUNK_SECONDS", "60"))
+MEDIA_CHUNK_OVERLAP_SECONDS = float(os.getenv("MEDIA_CHUNK_OVERLAP_SECONDS", "10"))
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Duration of a media file in seconds, or None if ffprobe can't tell."""
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                path
+            ],
+            check=True,
+            capture_output=True,
+            timeout=60
+        )
+        return float(result.stdout.decode().strip())
+    except Exception:
+        return None
+
+
+def plan_windows(duration: float, window: float = TRANSCRIBE_WINDOW_SECONDS,
+                 overlap: float = TRANSCRIBE_OVERLAP_SECONDS) -> List[Tuple[float, float]]:
+    """Split [0, duration) into windows of `window` seconds that overlap by `overlap`."""
+    windows = []
+    start = 0.0
+    step = window - overlap
+    while start < duration:
+        end = min(start + window, duration)
+        windows.append((start, end))
+        if end >= duration:
+            break
+        start += step
+    return windows
+
+
+# Speech is sent to transcription as mono 16kHz Opus: Whisper resamples to
+# 16kHz anyway, and at 24 kbit/s an hour of audio is ~11 MB instead of the
+# ~60 MB of 128k mp3 or ~110 MB of 16-bit WAV.
+SPEECH_CODEC_ARGS = ["-c:a", "libopus", "-b:a", os.getenv("SPEECH_BITRATE", "24k"), "-application", "voip"]
+SPEECH_FORMAT = "ogg"
+SPEECH_CONTENT_TYPE = "audio/ogg"
+
+
+def transcription_params() -> str:
+    """The settings that shape a transcript; part of the transcript cache key."""
+    vad = f"{VAD_NOISE_DB}:{VAD_MIN_SILENCE_SECONDS}:{VAD_PADDING_SECONDS}:{VAD_MIN_SAVINGS}" if VAD_ENABLED else "off"
+    return f"vad={vad}|window={TRANSCRIBE_WINDOW_SECONDS}:{TRANSCRIBE_OVERLAP_SECONDS}"
+
+
+def _run_ffmpeg(args: List[str], timeout: int = FFMPEG_TIMEOUT_SECONDS, loglevel: str = "error") -> Tuple[bytes, bytes]:
+    """
+    Run ffmpeg and return (stdout, stderr).
+    The process is killed and reaped on timeout or any other error.
+    """
+    proc = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-v", loglevel, *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise HTTPException(status_code=500, detail=f"ffmpeg timed out after {timeout}s")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.communicate()
+
+    if proc.returncode != 0:
+        raise HTTPException(status_code=500, detail=f"ffmpeg error extracting audio: {stderr.decode(errors='replace')}")
+    return stdout, stderr
+
+
+def _select_filter(regions: List[Tuple[float, float]]) -> str:
+    """ffmpeg audio filter keeping only `regions` (seconds) and closing the gaps."""
+    terms = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in regions)
+    return f"aselect='{terms}',asetpts=N/SR/TB"
+
+
+def encode_audio(path: str, start: Optional[float] = None, end: Optional[float] = None,
+                 regions: Optional[List[Tuple[float, float]]] = None) -> bytes:
+    """
+    Encode the audio track of a media file (or its [start, end) slice) as
+    compact speech audio, streamed from ffmpeg's stdout. No temp files.
+    If `regions` is given (original-media seconds), only those parts are kept.
+    """
+    args = []
+    if start is not None:
+        args += ["-ss", f"{start:.3f}"]
+    if start is not None and end is not None:
+        args += ["-t", f"{end - start:.3f}"]
+    args += ["-i", path, "-vn"]
+    if regions:
+        # After input seeking the filter's clock starts at 0
+        offset = start or 0.0
+        args += ["-af", _select_filter([(s - offset, e - offset) for s, e in regions])]
+    args += ["-ar", "16000", "-ac", "1", *SPEECH_CODEC_ARGS, "-f", SPEECH_FORMAT, "pipe:1"]
+    return _run_ffmpeg(args)[0]
+
+
+def detect_speech(path: str, duration: float) -> Optional[List[Tuple[float, float]]]:
+    """
+    Find the speech regions of a recording with ffmpeg's silencedetect.
+    Returns padded, merged (start, end) regions in original-media seconds,
+    or None when trimming wouldn't save at least VAD_MIN_SAVINGS of the audio.
+    """
+    _, log = _run_ffmpeg(
+        ["-i", path, "-vn", "-af", f"silencedetect=noise={VAD_NOISE_DB}dB:d={VAD_MIN_SILENCE_SECONDS}", "-f", "null", "-"],
+        loglevel="info"
+    )
+
+    silences = []
+    silence_start = None
+    for line in log.decode(errors="replace").splitlines():
+        if "silence_start:" in line:
+            silence_start = float(line.split("silence_start:")[1].split()[0])
+        elif "silence_end:" in line and silence_start is not None:
+            silences.append((max(silence_start, 0.0), float(line.split("silence_end:")[1].split()[0])))
+            silence_start = None
+    if silence_start is not None:
+        silences.append((silence_start, duration))
+
+    regions = []
+    cursor = 0.0
+    for silence_start, silence_end in silences + [(duration, duration)]:
+        if silence_start > cursor:
+            start = max(cursor - VAD_PADDING_SECONDS, 0.0)
+            end = min(silence_start + VAD_PADDING_SECONDS, duration)
+            if regions and start <= regions[-1][1]:
+                regions[-1] = (regions[-1][0], end)
+            else:
+                regions.append((start, end))
+        cursor = max(cursor, silence_end)
+
+    speech = sum(end - start for start, end in regions)
+    if not regions or duration - speech < duration * VAD_MIN_SAVINGS:
+        return None
+    return regions
+
+
+class OffsetMap:
+    """
+    Maps times on the trimmed, speech-only timeline back to the original media.
+    The trimmed timeline is the concatenation of `regions`.
+    """
+
+    def __init__(self, regions: List[Tuple[float, float]]):
+        self.regions = regions
+        self.trimmed_starts = []
+        total = 0.0
+        for start, end in regions:
+            self.trimmed_starts.append(total)
+            total += end - start
+        self.duration = total
+
+    def to_original(self, t: float, is_end: bool = False) -> float:
+        # An end time exactly on a cut belongs to the region before it
+        k = (bisect_left if is_end else bisect_right)(self.trimmed_starts, t) - 1
+        k = min(max(k, 0), len(self.regions) - 1)
+        start, end = self.regions[k]
+        return min(start + (t - self.trimmed_starts[k]), end)
+
+    def regions_between(self, t_start: float, t_end: float) -> List[Tuple[float, float]]:
+        """Original-media regions that make up [t_start, t_end) of the trimmed timeline."""
+        o_start = self.to_original(t_start)
+        o_end = self.to_original(t_end, is_end=True)
+        return [
+            (max(start, o_start), min(end, o_end))
+            for start, end in self.regions
+            if end > o_start and start < o_end
+        ]
+
+    def remap_segments(self, segments: List[dict]) -> List[dict]:
+        return [
+            {
+                **seg,
+                "start": round(self.to_original(seg["start"]), 3),
+                "end": round(self.to_original(seg["end"], is_end=True), 3),
+            }
+            for seg in segments
+        ]
+
+
+def stitch_segments(windows: List[Tuple[float, float, List[dict]]]) -> List[dict]:
+    """
+    Merge per-window transcripts into one timeline.
+
+    `windows` holds (window_start, window_end, segments) with segment times
+    relative to the window. Neighbouring windows overlap, so each window only
+    keeps segments whose midpoint falls in the part of the overlap closest to
+    it; a sentence spoken in the overlap is kept exactly once.
+    """
+    stitched = []
+    windows = sorted(windows, key=lambda w: w[0])
+    for i, (start, end, segments) in enumerate(windows):
+        own_start = 0.0 if i == 0 else (start + windows[i - 1][1]) / 2
+        own_end = float("inf") if i == len(windows) - 1 else (end + windows[i + 1][0]) / 2
+        for seg in segments:
+            seg_start = seg["start"] + start
+            seg_end = seg["end"] + start
+            midpoint = (seg_start + seg_end) / 2
+            if own_start <= midpoint < own_end:
+                stitched.append({"text": seg["text"], "start": seg_start, "end": seg_end})
+    return stitched
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for sizing chunks."""
+    return max(1, len(text) // 4)
+
+
+def _make_window(segments: List[dict]) -> dict:
+    parts = []
+    boundaries = []
+    offset = 0
+    for seg in segments:
+        # [start, end, character offset of the segment in the window text]
+        boundaries.append([round(seg["start"], 3), round(seg["end"], 3), offset])
+        parts.append(seg["text"])
+        offset += len(seg["text"]) + 1
+    return {
+        "text": " ".join(parts),
+        "start": segments[0]["start"],
+        "end": segments[-1]["end"],
+        "segments": boundaries,
+    }
+
+
+def merge_segments(segments: List[dict], max_tokens: int = MEDIA_CHUNK_TOKENS,
+                   max_seconds: float = MEDIA_CHUNK_SECONDS,
+                   overlap_seconds: float = MEDIA_CHUNK_OVERLAP_SECONDS) -> List[dict]:
+    """
+    Merge consecutive transcript segments into retrieval windows.
+
+    A window grows until adding the next segment would exceed `max_tokens`
+    or `max_seconds`; the next window re-includes the trailing segments that
+    started within `overlap_seconds` of the end. Each window keeps its
+    start/end span and the original segment boundaries for fine seeking.
+    """
+    segments = [seg for seg in segments if seg["text"]]
+    windows = []
+    i = 0
+    while i < len(segments):
+        j = i
+        tokens = 0
+        while j < len(segments):
+            seg_tokens = estimate_tokens(segments[j]["text"])
+            too_long = segments[j]["end"] - segments[i]["start"] > max_seconds
+            if j > i and (tokens + seg_tokens > max_tokens or too_long):
+                break
+            tokens += seg_tokens
+            j += 1
+        windows.append(_make_window(segments[i:j]))
+        if j >= len(segments):
+            break
+
+        # Step back for overlap, but always advance by at least one segment
+        k = j
+        while k - 1 > i and segments[k - 1]["start"] >= segments[j - 1]["end"] - overlap_seconds:
+            k -= 1
+        i = k
+    return windows
+
+
+def _words(text: str) -> set:
+    return {w for w in re.findall(r"\w+", text.lower()) if len(w) > 2}
+
+
+def locate_in_window(meta: dict, query: str) -> Tuple[float, float]:
+    """
+    Narrow a matched window down to the original segment that best matches
+    the query (by word overlap), for a precise seek position. Falls back to
+    the window span, e.g. for vectors indexed before windows existed.
+    """
+    start, end = meta.get("start", 0.0), meta.get("end", 0.0)
+    if not meta.get("segments"):
+        return start, end
+
+    boundaries = json.loads(meta["segments"])
+    text = meta.get("text", "")
+    query_words = _words(query)
+    best, best_score = None, 0
+    for n, (seg_start, seg_end, offset) in enumerate(boundaries):
+        stop = boundaries[n + 1][2] if n + 1 < len(boundaries) else len(text)
+        score = len(query_words & _words(text[offset:stop]))
+        if score > best_score:
+            best, best_score = (seg_start, seg_end), score
+    return best or (start, end)
@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, UniqueConstraint, Float, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
@@ -31,9 +31,67 @@ class Document(Base):
     #updated_at = Column(DateTime, default=datetime.utc, onupdate=datetime.utc)
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     user_id = Column(Integer, ForeignKey("users.id"))
+    transcript_id = Column(Integer, ForeignKey("transcripts.id"), nullable=True)  # media only
+    routing_indexed = Column(Boolean, default=False)  # centroid stored in user_{user_id}_docs
     
     owner = relationship("User", back_populates="documents")
     queries = relationship("Query", back_populates="document")
+    transcript = relationship("Transcript")
+
+
+class Transcript(Base):
+    __tablename__ = "transcripts"
+    __table_args__ = (UniqueConstraint("audio_hash", "params", name="uq_transcripts_audio_hash_params"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    audio_hash = Column(String(64), index=True)  # sha256 of the uploaded file
+    params = Column(String)  # model and trimming/windowing settings it was produced with
+    segments = Column(Text)  # JSON list of {text, start, end}
+    segment_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
+    chunk_index = Column(Integer)
+    vector_id = Column(String, unique=True, index=True)  # doc_{id}_chunk_{i} (plus a suffix if taken), or doc_{id}_seg_{i} for media
+    content_hash = Column(String(64))  # sha256 of the chunk text
+    page = Column(Integer, nullable=True)
+    content = Column(LargeBinary, nullable=True)  # zlib-compressed chunk text
+    start_time = Column(Float, nullable=True)  # media windows, seconds
+    end_time = Column(Float, nullable=True)
+    segments = Column(Text, nullable=True)  # media windows: JSON [start, end, offset] per segment
+
+    document = relationship("Document")
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, unique=True, index=True)
+    kind = Column(String)  # "pdf", "media", "pdf_update" or "media_reindex"
+    filename = Column(String)
+    status = Column(String, default="queued")  # queued | running | completed | failed
+    stage = Column(String, default="queued")
+    chunks_total = Column(Integer, default=0)
+    chunks_embedded = Column(Integer, default=0)
+    chunks_upserted = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON summary once completed
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)
+    # API process running the job, and when it last reported being alive
+    owner = Column(String, nullable=True, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    document = relationship("Document")
+
 
 class Query(Base):
     __tablename__ = "queries"
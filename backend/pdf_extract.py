@@ -0,0 +1,98 @@
+# pdf_extract.py
+import os
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple, Union
+
+from fastapi import HTTPException
+
+
+# Documents with at least this many pages are extracted on a process pool,
+# PDF_PAGES_PER_TASK pages per task. Smaller ones aren't worth the spawn cost.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+_pool = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process is multi-threaded
+        _pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def _extract_range(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Worker: extract pages [start, stop) from the PDF at path. Page numbers are 1-based."""
+    import fitz  # PyMuPDF, imported on first use to keep worker start-up fast
+    with fitz.open(path) as doc:
+        return [(n + 1, doc[n].get_text()) for n in range(start, stop)]
+
+
+def _iter_parallel(path: str, page_count: int) -> Iterator[Tuple[int, str]]:
+    # Keep only a couple of ranges per worker in flight so peak memory stays
+    # bounded no matter how long the document is; results are yielded in order.
+    ranges = deque(
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    )
+    pool = _get_pool()
+    in_flight = deque()
+    max_in_flight = PDF_WORKERS * 2
+
+    while ranges or in_flight:
+        while ranges and len(in_flight) < max_in_flight:
+            start, stop = ranges.popleft()
+            in_flight.append(pool.submit(_extract_range, path, start, stop))
+        for page in in_flight.popleft().result():
+            yield page
+
+
+def iter_pdf_pages(source: Union[str, bytes]) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_number, text) for each page of a PDF, in order.
+    `source` is a file path or the raw PDF bytes.
+    """
+    import fitz  # PyMuPDF, imported on first use to keep worker start-up fast
+
+    tmp_path = None
+    try:
+        if isinstance(source, str):
+            doc = fitz.open(source)
+        else:
+            doc = fitz.open(stream=source, filetype="pdf")
+
+        with doc:
+            page_count = doc.page_count
+            if page_count < PDF_PARALLEL_MIN_PAGES:
+                for n in range(page_count):
+                    yield n + 1, doc[n].get_text()
+                return
+
+        path = source
+        if not isinstance(source, str):
+            # Workers open the file themselves rather than each receiving a copy of the bytes
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                tmp.write(source)
+                tmp_path = tmp.name
+            path = tmp_path
+
+        yield from _iter_parallel(path, page_count)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error extracting text: {str(e)}")
+    finally:
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except Exception:
+                pass
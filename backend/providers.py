@@ -0,0 +1,133 @@
+# providers.py
+"""
+External service clients, created on first use.
+
+Importing this module neither imports a provider SDK nor touches the
+network, so a worker can serve `/` and the auth routes right after start and
+without the providers being reachable. Index and table creation is a
+separate step: see provision.py.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from embedding_cache import EmbeddingCache, EMBED_CACHE_ENABLED, QueryEmbeddingCache, QUERY_EMBED_CACHE_ENABLED
+from answer_cache import AnswerCache, ANSWER_CACHE_ENABLED
+from lexical_index import LexicalIndex, LEXICAL_ENABLED
+
+load_dotenv()
+
+_lock = threading.RLock()
+_groq_client = None
+_gemini_client = None
+_embedding_cache = None
+_query_cache = None
+_answer_cache = None
+_lexical_index = None
+_embedder = None
+_vector_store = None
+_cloudinary_configured = False
+
+
+def get_groq_client():
+    """Groq, for text generation and Whisper transcription."""
+    global _groq_client
+    if _groq_client is None:
+        with _lock:
+            if _groq_client is None:
+                from groq import Groq
+                _groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    return _groq_client
+
+
+def get_gemini_client():
+    """Gemini, for embeddings."""
+    global _gemini_client
+    if _gemini_client is None:
+        with _lock:
+            if _gemini_client is None:
+                from google import genai
+                _gemini_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    return _gemini_client
+
+
+def get_embedding_cache():
+    """The chunk embedding cache, or None when EMBED_CACHE_ENABLED is off."""
+    global _embedding_cache
+    if _embedding_cache is None and EMBED_CACHE_ENABLED:
+        with _lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+
+def get_query_cache():
+    """The question embedding cache, or None when QUERY_EMBED_CACHE_ENABLED is off."""
+    global _query_cache
+    if _query_cache is None and QUERY_EMBED_CACHE_ENABLED:
+        with _lock:
+            if _query_cache is None:
+                _query_cache = QueryEmbeddingCache()
+    return _query_cache
+
+
+def get_answer_cache():
+    """The semantic answer cache, or None when ANSWER_CACHE_ENABLED is off."""
+    global _answer_cache
+    if _answer_cache is None and ANSWER_CACHE_ENABLED:
+        with _lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
+
+
+def get_lexical_index():
+    """The BM25 chunk index, or None when LEXICAL_ENABLED is off."""
+    global _lexical_index
+    if _lexical_index is None and LEXICAL_ENABLED:
+        with _lock:
+            if _lexical_index is None:
+                _lexical_index = LexicalIndex()
+    return _lexical_index
+
+
+def get_embedder():
+    """Coalescing, so concurrent ingest jobs (e.g. a bulk upload) share full batches."""
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                from embeddings import CoalescingEmbedder
+                _embedder = CoalescingEmbedder(
+                    get_gemini_client(), cache=get_embedding_cache(), query_cache=get_query_cache()
+                )
+    return _embedder
+
+
+def get_vector_store():
+    """Pinecone, or the in-process local backend (VECTOR_STORE=local)."""
+    global _vector_store
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                from vector_store import create_vector_store
+                _vector_store = create_vector_store()
+    return _vector_store
+
+
+def get_cloudinary_uploader():
+    """The cloudinary.uploader module, configured from the environment."""
+    global _cloudinary_configured
+    import cloudinary
+    import cloudinary.uploader
+    if not _cloudinary_configured:
+        with _lock:
+            if not _cloudinary_configured:
+                cloudinary.config(
+                    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+                    api_key=os.getenv("CLOUDINARY_API_KEY"),
+                    api_secret=os.getenv("CLOUDINARY_API_SECRET")
+                )
+                _cloudinary_configured = True
+    return cloudinary.uploader
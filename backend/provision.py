@@ -0,0 +1,44 @@
+# provision.py
+"""
+One-off setup for a deployment, run before starting the API:
+creates missing database tables and the Pinecone index.
+
+    python provision.py
+    python provision.py --recreate-index   # replace an index with the wrong dimension
+"""
+import os
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import engine, Base  # noqa: E402
+import models  # noqa: E402,F401  (registers the tables)
+from vector_store import VECTOR_STORE, VECTOR_DIMENSION, provision_pinecone_index  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create database tables and the vector index.")
+    parser.add_argument("--skip-db", action="store_true", help="don't create database tables")
+    parser.add_argument("--recreate-index", action="store_true",
+                        help="delete and recreate a Pinecone index whose dimension doesn't match EMBEDDING_DIM")
+    args = parser.parse_args()
+
+    if not args.skip_db:
+        print("Creating database tables...")
+        Base.metadata.create_all(bind=engine)
+        print("Tables created.")
+
+    if VECTOR_STORE == "pinecone":
+        provision_pinecone_index(
+            os.getenv("PINECONE_API_KEY"),
+            dimension=VECTOR_DIMENSION,
+            recreate=args.recreate_index
+        )
+    else:
+        print(f"VECTOR_STORE={VECTOR_STORE}: no index to provision")
+
+
+if __name__ == "__main__":
+    main()
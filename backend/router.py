@@ -2,69 +2,52 @@ import json
 
 import requests
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Form, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.exc import IntegrityError
+from typing import TYPE_CHECKING, List, Optional
 import os
-import fitz  # PyMuPDF
-import cloudinary
-import cloudinary.uploader
 import uuid
-from datetime import datetime
-from dotenv import load_dotenv
-from groq import Groq
-from google import genai
-from pinecone import Pinecone, ServerlessSpec
 import io
-import tempfile
-import subprocess
+import zipfile
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from auth import get_current_user
 load_dotenv()
 
-from database import get_db
+from database import get_db, SessionLocal
+from jobs import create_job, submit_job, submit_bulk_job, job_to_dict, INGEST_WORKERS
+from embedding_cache import EMBED_CACHE_ENABLED, chunk_hash
+from chunk_store import pack_text, hydrate_matches, fetch_by_index, expand_context, as_chunk_index
+from pdf_extract import iter_pdf_pages
+from lexical_index import exact_terms, reciprocal_rank_fusion
+from providers import (
+    get_groq_client, get_gemini_client, get_embedder, get_embedding_cache,
+    get_query_cache, get_answer_cache, get_lexical_index, get_vector_store, get_cloudinary_uploader
+)
+from answer_cache import answer_scope
+from uploads import SpooledUpload, spool_upload, spool_fileobj, MAX_UPLOAD_MB
+from media import (
+    TRANSCRIBE_WINDOW_SECONDS, SPEECH_FORMAT, SPEECH_CONTENT_TYPE, VAD_ENABLED,
+    probe_duration, plan_windows, encode_audio, stitch_segments, detect_speech, OffsetMap,
+    merge_segments, locate_in_window, transcription_params
+)
 import models
 import schemas
 
-
-# Service configuration
+if TYPE_CHECKING:
+    # numpy-backed; imported where a centroid is built so importing the router doesn't load numpy
+    from vector_store import Centroid
 
 
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
-
-# Groq — for text generation 
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-# Gemini —   for embeddings 
-gemini_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
-
-# Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-INDEX_NAME = "pdf-documents"
-
-
-if INDEX_NAME in pc.list_indexes().names():
-    try:
-        index_info = pc.describe_index(INDEX_NAME)
-        if index_info.dimension != 3072:
-            print(f"Deleting old index with dimension {index_info.dimension}")
-            pc.delete_index(INDEX_NAME)
-            print("Old index deleted")
-    except Exception:
-        pass
-
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=3072,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-    print("New index created with dimension 3072")
+# Service configuration
 
-index = pc.Index(INDEX_NAME)
+# Provider clients (Groq, Gemini, the vector store, Cloudinary) and the
+# BM25 chunk index are created on first use by providers.py, not at import.
 
 router = APIRouter()
 
@@ -72,6 +55,14 @@ router = APIRouter()
 ALLOWED_AUDIO_TYPES = {".mp3", ".wav", ".m4a", ".ogg", ".flac", ".webm"}
 ALLOWED_VIDEO_TYPES = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
 ALLOWED_MEDIA_TYPES = ALLOWED_AUDIO_TYPES | ALLOWED_VIDEO_TYPES
+ALLOWED_ARCHIVE_TYPES = {".zip"}
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "500"))
+# Total size a .zip in a bulk upload may expand to; larger archives are rejected whole
+BULK_MAX_ARCHIVE_MB = int(os.getenv("BULK_MAX_ARCHIVE_MB", "4096"))
+
+
+class IngestCancelled(Exception):
+    pass
 
 
 class SimpleTextSplitter:
@@ -89,116 +80,455 @@ class SimpleTextSplitter:
             start += self.chunk_size - self.chunk_overlap
         return chunks
 
-
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    """Extract text from PDF bytes using PyMuPDF."""
-    text = ""
+    def split_pages(self, pages):
+        """
+        Chunk (page_number, text) pairs as they arrive.
+        Windows restart at each page, so every chunk belongs to exactly one
+        page and only one page of text is held at a time.
+        """
+        for page_number, text in pages:
+            for chunk in self.split_text(text):
+                yield {"text": chunk, "page": page_number}
+
+
+def _batched(items, size: int):
+    """Group any iterable into lists of at most `size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def get_embeddings(texts: List[str], progress=None) -> List[Optional[list]]:
+    """
+    Embed texts using Gemini embedding-001 (EMBEDDING_DIM-dim), batched and concurrent.
+    Texts the API rejects come back as None (see skip_rejected).
+    """
     try:
-        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-            for page in doc:
-                text += page.get_text()
+        return get_embedder().embed(texts, progress=progress)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error extracting text: {str(e)}")
-    return text
+        raise HTTPException(status_code=500, detail=f"Embedding error: {str(e)}")
+
+
+def skip_rejected(embeddings: List[Optional[list]], document_id: int, progress=None) -> int:
+    """Report the chunks whose embedding was rejected; they are left out of the index."""
+    failed = sum(1 for embedding in embeddings if embedding is None)
+    if failed:
+        print(f"Document {document_id}: skipped {failed} chunk(s) the embedding API rejected")
+        if progress:
+            progress.failed(failed)
+    return failed
+
+
+def embed_query(text: str) -> list:
+    """Embed a question, cut to the same dimension as the stored vectors."""
+    return get_embedder().embed_query(text)
 
 
-def get_embeddings(texts: List[str]) -> List[list]:
-    """Embed texts using Gemini embedding-001 (3072-dim)."""
+# Fixed retrieval prompts, embedded once per worker
+SUMMARY_QUERY = "main topics summary overview key points"
+_fixed_query_vectors = {}
+
+
+def fixed_query_vector(text: str) -> list:
+    vector = _fixed_query_vectors.get(text)
+    if vector is None:
+        vector = _fixed_query_vectors[text] = embed_query(text)
+    return vector
+
+
+def warm_fixed_queries():
+    """Embed the fixed prompts before the first request needs them (run at startup)."""
     try:
-        embeddings = []
-        for text in texts:
-            result = gemini_client.models.embed_content(
-                model="models/gemini-embedding-001",
-                contents=text
-            )
-            embeddings.append(result.embeddings[0].values)
-        return embeddings
+        fixed_query_vector(SUMMARY_QUERY)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Embedding error: {str(e)}")
+        # Left to the first request that needs them
+        print(f"Could not embed fixed queries at startup: {str(e)}")
+
+
+GENERATION_MODEL = "llama-3.3-70b-versatile"
 
 
 def groq_generate(prompt: str, max_tokens: int = 1024) -> str:
     """Generate text using Groq LLaMA 3.3 70B."""
-    response = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
+    response = get_groq_client().chat.completions.create(
+        model=GENERATION_MODEL,
         messages=[{"role": "user", "content": prompt}],
         max_tokens=max_tokens
     )
     return response.choices[0].message.content.strip()
 
 
-def create_vectorstore(text: str, document_id: int) -> int:
-    """Chunk text, embed, and upsert into Pinecone under doc namespace."""
+def groq_stream(prompt: str, max_tokens: int = 1024):
+    """Like groq_generate, but yields the text as it is generated."""
+    stream = get_groq_client().chat.completions.create(
+        model=GENERATION_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        stream=True
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+QUERY_FANOUT_CONCURRENCY = int(os.getenv("QUERY_FANOUT_CONCURRENCY", "16"))
+QUERY_FANOUT_TIMEOUT_SECONDS = float(os.getenv("QUERY_FANOUT_TIMEOUT_SECONDS", "5"))
+_query_executor = ThreadPoolExecutor(max_workers=QUERY_FANOUT_CONCURRENCY, thread_name_prefix="query")
+
+
+def query_namespaces(vector, namespaces: List[str], top_k: int,
+                     timeout: float = QUERY_FANOUT_TIMEOUT_SECONDS) -> tuple:
+    """
+    Query many namespaces concurrently.
+    Returns ({namespace: matches}, failed_namespaces) for whatever answered
+    within `timeout`; errors and stragglers are logged and reported as failed.
+    """
+    futures = {
+        _query_executor.submit(get_vector_store().query, vector=vector, top_k=top_k, namespace=ns, include_metadata=True): ns
+        for ns in namespaces
+    }
+    done, pending = wait(futures, timeout=timeout)
+
+    results = {}
+    failed = []
+    for future in done:
+        namespace = futures[future]
+        try:
+            results[namespace] = future.result()["matches"]
+        except Exception as e:
+            print(f"Query on namespace {namespace} failed: {str(e)}")
+            failed.append(namespace)
+    for future in pending:
+        future.cancel()
+        failed.append(futures[future])
+    if pending:
+        print(f"{len(pending)} of {len(namespaces)} namespace queries missed the {timeout}s deadline")
+    return results, failed
+
+
+def upsert_vectors(vectors: List[dict], namespace: str, progress=None):
+    """Upsert vectors into Pinecone in batches of 100."""
+    batch_size = 100
+    for i in range(0, len(vectors), batch_size):
+        batch = vectors[i:i + batch_size]
+        get_vector_store().upsert(vectors=batch, namespace=namespace)
+        if progress:
+            progress.upserted(len(batch))
+
+
+# /query-all/ first picks this many candidate documents by centroid, then
+# searches only their chunks.
+ROUTING_TOP_DOCS = int(os.getenv("ROUTING_TOP_DOCS", "20"))
+
+
+def routing_namespace(user_id: int) -> str:
+    return f"user_{user_id}_docs"
+
+
+def route_document(document_id: int, centroid: Optional["Centroid"]):
+    """
+    Store a document's centroid in its owner's routing namespace and mark it
+    routable. Failures only cost speed: unrouted documents are always searched.
+    """
+    vector = centroid.vector() if centroid is not None else None
+    if vector is None:
+        return
+    db = SessionLocal()
     try:
-        splitter = SimpleTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_text(text)
-        embeddings = get_embeddings(chunks)
+        document = db.query(models.Document).filter(models.Document.id == document_id).first()
+        get_vector_store().upsert(
+            vectors=[{"id": f"doc_{document_id}", "values": vector, "metadata": {"document_id": document_id}}],
+            namespace=routing_namespace(document.user_id)
+        )
+        document.routing_indexed = True
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Failed to store routing centroid for document {document_id}: {str(e)}")
+    finally:
+        db.close()
 
-        vectors = []
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            vectors.append({
-                "id": f"doc_{document_id}_chunk_{i}",
-                "values": embedding,
-                "metadata": {
-                    "document_id": document_id,
-                    "chunk_index": i,
-                    "text": chunk
-                }
-            })
 
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            index.upsert(vectors=vectors[i:i + batch_size], namespace=f"doc_{document_id}")
+# Chunks are embedded and upserted in groups of this size while the
+# extractor keeps producing pages, so a huge PDF never sits in memory whole.
+VECTOR_GROUP_SIZE = 500
 
-        return len(vectors)
+
+def _index_chunks(indexed_chunks: List[tuple], document_id: int, progress=None,
+                  centroid: Optional["Centroid"] = None,
+                  vector_ids: Optional[List[str]] = None) -> List[models.DocumentChunk]:
+    """
+    Embed and upsert (chunk_index, {text, page}) pairs, as doc_{id}_chunk_{i}
+    unless `vector_ids` are given. Returns the chunk registry rows describing
+    what was written; chunks the embedding API rejected are skipped.
+    """
+    embeddings = get_embeddings([c["text"] for _, c in indexed_chunks], progress=progress)
+    skip_rejected(embeddings, document_id, progress)
+    if centroid is not None:
+        centroid.add(embeddings)
+
+    vectors = []
+    rows = []
+    for n, ((i, chunk), embedding) in enumerate(zip(indexed_chunks, embeddings)):
+        if embedding is None:
+            continue
+        vector_id = vector_ids[n] if vector_ids else f"doc_{document_id}_chunk_{i}"
+        vectors.append({
+            "id": vector_id,
+            "values": embedding,
+            "metadata": {
+                "document_id": document_id,
+                "chunk_index": i,
+                "page": chunk["page"]
+            }
+        })
+        rows.append(models.DocumentChunk(
+            document_id=document_id,
+            chunk_index=i,
+            vector_id=vector_id,
+            content_hash=chunk_hash(chunk["text"]),
+            page=chunk["page"],
+            content=pack_text(chunk["text"])
+        ))
+
+    if progress:
+        progress.stage("upserting")
+    upsert_vectors(vectors, f"doc_{document_id}", progress)
+    return rows
+
+
+def create_vectorstore(chunks, document_id: int, db: Session, progress=None, cancel=None) -> int:
+    """
+    Embed chunks ({text, page}) and upsert into Pinecone under doc namespace.
+    `chunks` may be a generator; it is consumed in bounded groups.
+    Stops between groups once the optional `cancel` event is set.
+    """
+    try:
+        from vector_store import Centroid
+
+        lexical_index = get_lexical_index()
+        count = 0
+        indexed = 0
+        centroid = Centroid()
+        for group in _batched(enumerate(chunks), VECTOR_GROUP_SIZE):
+            if cancel is not None and cancel.is_set():
+                raise IngestCancelled("Ingestion cancelled")
+            if progress:
+                progress.add_total(len(group))
+                progress.stage("embedding")
+            rows = _index_chunks(group, document_id, progress, centroid)
+            db.add_all(rows)
+            db.commit()
+            if lexical_index is not None:
+                lexical_index.add_chunks(document_id, group)
+            count += len(group)
+            indexed += len(rows)
+
+        if count and not indexed:
+            raise HTTPException(status_code=500, detail="The embedding API rejected every chunk of the document")
+        route_document(document_id, centroid)
+        return count
+    except (HTTPException, IngestCancelled):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Vector store error: {str(e)}")
 
 
-def create_media_vectorstore(segments: List[dict], document_id: int) -> int:
+def _take_matching(pool: dict, content_hash: str, index: int):
+    """Pop an existing row with this hash, preferring one already at `index`."""
+    rows = pool.get(content_hash)
+    if not rows:
+        return None
+    for position, row in enumerate(rows):
+        if row.chunk_index == index:
+            return rows.pop(position)
+    return rows.pop(0)
+
+
+def update_vectorstore(chunks, document_id: int, db: Session, progress=None, cancel=None) -> dict:
     """
-    Embed transcript segments and upsert into Pinecone.
+    Bring a document's vectors in line with new chunks.
+    New chunks are matched to stored ones by content hash (duplicates count
+    separately), so text that only moved keeps its vector and id and just
+    gets its chunk_index and page rewritten. Only hashes that weren't stored
+    before are embedded; stored chunks left unmatched are deleted.
+    """
+    try:
+        namespace = f"doc_{document_id}"
+        existing = db.query(models.DocumentChunk).filter(
+            models.DocumentChunk.document_id == document_id
+        ).order_by(models.DocumentChunk.chunk_index).all()
+        if not existing:
+            # Indexed before chunk hashes were recorded: stale ids are unknown, start clean
+            get_vector_store().delete(delete_all=True, namespace=namespace)
+        pool = {}
+        for row in existing:
+            pool.setdefault(row.content_hash, []).append(row)
+        # New chunks can't take an id that a kept (or not yet deleted) vector still has
+        taken_ids = {row.vector_id for row in existing}
+
+        from vector_store import Centroid
+
+        lexical_index = get_lexical_index()
+        count = 0
+        changed = 0
+        moved = 0
+        # The routing centroid needs every chunk's vector; reused ones are
+        # only cheap to get back from the embedding cache, so without it the
+        # previous centroid is kept.
+        centroid = Centroid() if EMBED_CACHE_ENABLED else None
+        for group in _batched(enumerate(chunks), VECTOR_GROUP_SIZE):
+            if cancel is not None and cancel.is_set():
+                raise IngestCancelled("Ingestion cancelled")
+            count += len(group)
+            fresh = []
+            reused = []
+            for i, chunk in group:
+                row = _take_matching(pool, chunk_hash(chunk["text"]), i)
+                if row is None:
+                    fresh.append((i, chunk))
+                    continue
+                reused.append(chunk["text"])
+                if row.content is None:
+                    # Indexed before the chunk store
+                    row.content = pack_text(chunk["text"])
+                if row.chunk_index != i or row.page != chunk["page"]:
+                    get_vector_store().update_metadata(
+                        row.vector_id, {"chunk_index": i, "page": chunk["page"]}, namespace
+                    )
+                    row.chunk_index = i
+                    row.page = chunk["page"]
+                    moved += 1
+            if lexical_index is not None:
+                # Re-indexing text is cheap; doing all of it also covers documents indexed before BM25
+                lexical_index.add_chunks(document_id, group)
+            if centroid is not None:
+                centroid.add(get_embeddings(reused))
+            if fresh:
+                if progress:
+                    progress.add_total(len(fresh))
+                    progress.stage("embedding")
+                vector_ids = []
+                for i, _ in fresh:
+                    vector_id = f"doc_{document_id}_chunk_{i}"
+                    if vector_id in taken_ids:
+                        vector_id = f"{vector_id}_{uuid.uuid4().hex[:8]}"
+                    taken_ids.add(vector_id)
+                    vector_ids.append(vector_id)
+                rows = _index_chunks(fresh, document_id, progress, centroid, vector_ids)
+                db.add_all(rows)
+                changed += len(rows)
+            db.commit()
+
+        removed = [row for rows in pool.values() for row in rows]
+        removed_ids = [row.vector_id for row in removed]
+        for i in range(0, len(removed_ids), 1000):
+            get_vector_store().delete(ids=removed_ids[i:i + 1000], namespace=namespace)
+        for row in removed:
+            db.delete(row)
+        db.commit()
+        if lexical_index is not None:
+            lexical_index.truncate(document_id, count)
+
+        route_document(document_id, centroid)
+        return {
+            "chunk_count": count,
+            "chunks_changed": changed,
+            "chunks_moved": moved,
+            "chunks_removed": len(removed)
+        }
+    except (HTTPException, IngestCancelled):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Vector store update error: {str(e)}")
+
+
+def create_media_vectorstore(segments: List[dict], document_id: int, db: Session,
+                             progress=None, cancel=None) -> int:
+    """
+    Merge transcript segments into time windows, embed them and upsert into Pinecone.
     Each segment dict: {text, start, end}
-    Timestamp metadata is stored alongside the text so Q&A can return seek positions.
+    Timestamps are stored as vector metadata so Q&A can return seek positions;
+    window text and its original segment boundaries (as JSON, for finer
+    seeking) go to the chunk store.
     """
     try:
-        texts = [seg["text"] for seg in segments]
-        embeddings = get_embeddings(texts)
+        windows = merge_segments(segments)
+        texts = [w["text"] for w in windows]
+        if progress:
+            progress.set_total(len(texts))
+            progress.stage("embedding")
+        embeddings = get_embeddings(texts, progress=progress)
+        if cancel is not None and cancel.is_set():
+            raise IngestCancelled("Ingestion cancelled")
+        if texts and skip_rejected(embeddings, document_id, progress) == len(texts):
+            raise HTTPException(status_code=500, detail="The embedding API rejected every transcript window")
+        from vector_store import Centroid
+
+        centroid = Centroid()
+        centroid.add(embeddings)
 
         vectors = []
-        for i, (seg, embedding) in enumerate(zip(segments, embeddings)):
+        rows = []
+        for i, (window, embedding) in enumerate(zip(windows, embeddings)):
+            if embedding is None:
+                continue
             vectors.append({
                 "id": f"doc_{document_id}_seg_{i}",
                 "values": embedding,
                 "metadata": {
                     "document_id": document_id,
                     "segment_index": i,
-                    "text": seg["text"],
-                    "start": seg.get("start", 0.0),   # seconds (float)
-                    "end": seg.get("end", 0.0),
+                    "start": window["start"],   # seconds (float)
+                    "end": window["end"],
                 }
             })
-
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            index.upsert(vectors=vectors[i:i + batch_size], namespace=f"doc_{document_id}")
+            rows.append(models.DocumentChunk(
+                document_id=document_id,
+                chunk_index=i,
+                vector_id=f"doc_{document_id}_seg_{i}",
+                content_hash=chunk_hash(window["text"]),
+                content=pack_text(window["text"]),
+                start_time=window["start"],
+                end_time=window["end"],
+                segments=json.dumps(window["segments"])
+            ))
+
+        if progress:
+            progress.stage("upserting")
+        upsert_vectors(vectors, f"doc_{document_id}", progress)
+        db.add_all(rows)
+        db.commit()
+        route_document(document_id, centroid)
 
         return len(vectors)
+    except (HTTPException, IngestCancelled):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Media vector store error: {str(e)}")
 
 
-def transcribe_with_groq(audio_bytes: bytes, filename: str) -> List[dict]:
-    """Transcribe audio using Groq Whisper with timestamp segments."""
-    try:
-        audio_file = (filename, io.BytesIO(audio_bytes), "audio/mpeg")
+WHISPER_MODEL = "whisper-large-v3"
 
-        transcription = groq_client.audio.transcriptions.create(
-            file=audio_file,
-            model="whisper-large-v3",
-            response_format="verbose_json",
-            timestamp_granularities=["segment"]
-        )
+
+def transcribe_with_groq(audio, filename: str, content_type: str = "audio/mpeg") -> List[dict]:
+    """
+    Transcribe audio using Groq Whisper with timestamp segments.
+    `audio` is a path to a file on disk or encoded audio bytes.
+    """
+    try:
+        with (open(audio, "rb") if isinstance(audio, str) else io.BytesIO(audio)) as f:
+            transcription = get_groq_client().audio.transcriptions.create(
+                file=(filename, f, content_type),
+                model=WHISPER_MODEL,
+                response_format="verbose_json",
+                timestamp_granularities=["segment"]
+            )
 
         segments = []
         raw_segments = getattr(transcription, "segments", None)
@@ -227,55 +557,167 @@ def transcribe_with_groq(audio_bytes: bytes, filename: str) -> List[dict]:
         raise HTTPException(status_code=500, detail=f"Transcription error: {str(e)}")
 
 
-def extract_audio_from_video(video_bytes: bytes, original_filename: str) -> tuple[bytes, str]:
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+_transcribe_executor = ThreadPoolExecutor(max_workers=TRANSCRIBE_CONCURRENCY, thread_name_prefix="transcribe")
+
+
+def transcribe_media(path: str, filename: str, is_video: bool) -> List[dict]:
     """
-    Extract audio track from video using ffmpeg (must be installed on server).
-    Returns (audio_bytes, audio_filename).
+    Transcribe an audio or video file into timestamped segments.
+    Silence is cut out first (see detect_speech) and segment times are mapped
+    back to the original media. Recordings longer than one window are split
+    into overlapping windows, transcribed concurrently and stitched back into
+    a single timeline.
     """
-    ext = os.path.splitext(original_filename)[1].lower()
-    tmp_video_path = None
-    tmp_audio_path = None
-    
+    duration = probe_duration(path)
+    stem = os.path.splitext(filename)[0]
+
+    if duration is None and not is_video:
+        # ffprobe couldn't read it; let Whisper try the original file
+        return transcribe_with_groq(path, filename)
+
+    offsets = None
+    if VAD_ENABLED and duration:
+        try:
+            regions = detect_speech(path, duration)
+        except HTTPException as e:
+            print(f"Speech detection failed for {filename}, transcribing untrimmed: {e.detail}")
+            regions = None
+        if regions:
+            offsets = OffsetMap(regions)
+            print(f"Trimmed {filename} from {duration:.0f}s to {offsets.duration:.0f}s of speech")
+
+    def encode(start: Optional[float], end: Optional[float]) -> bytes:
+        if offsets is None:
+            return encode_audio(path, start, end)
+        # Windows are on the trimmed timeline; cut the matching speech out of the original
+        regions = offsets.regions_between(start or 0.0, offsets.duration if end is None else end)
+        return encode_audio(path, regions[0][0], regions[-1][1], regions)
+
+    timeline = offsets.duration if offsets else duration
+
+    if timeline is None or timeline <= TRANSCRIBE_WINDOW_SECONDS:
+        segments = transcribe_with_groq(encode(None, None), f"{stem}.{SPEECH_FORMAT}", SPEECH_CONTENT_TYPE)
+        return offsets.remap_segments(segments) if offsets else segments
+
+    def transcribe_window(start: float, end: float):
+        audio_bytes = encode(start, end)
+        return start, end, transcribe_with_groq(audio_bytes, f"{stem}_{int(start)}.{SPEECH_FORMAT}", SPEECH_CONTENT_TYPE)
+
+    windows = plan_windows(timeline)
+    futures = [_transcribe_executor.submit(transcribe_window, start, end) for start, end in windows]
     try:
-        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp_video:
-            tmp_video.write(video_bytes)
-            tmp_video_path = tmp_video.name
-
-        tmp_audio_path = tmp_video_path.replace(ext, ".mp3")
-
-        subprocess.run(
-            [
-                "ffmpeg", "-y",
-                "-i", tmp_video_path,
-                "-vn",                   
-                "-acodec", "libmp3lame",
-                "-ar", "16000",          
-                "-ac", "1",              
-                tmp_audio_path
-            ],
-            check=True,
-            capture_output=True
-        )
+        results = [f.result() for f in futures]
+    except Exception:
+        for f in futures:
+            f.cancel()
+        raise
+    segments = stitch_segments(results)
+    return offsets.remap_segments(segments) if offsets else segments
 
-        with open(tmp_audio_path, "rb") as f:
-            audio_bytes = f.read()
 
-        return audio_bytes, os.path.basename(tmp_audio_path)
+def _find_transcript(db: Session, audio_hash: str, params: str) -> Optional[models.Transcript]:
+    return db.query(models.Transcript).filter(
+        models.Transcript.audio_hash == audio_hash,
+        models.Transcript.params == params
+    ).first()
 
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"ffmpeg error extracting audio: {e.stderr.decode()}"
+
+def load_transcript(upload: SpooledUpload, is_video: bool) -> models.Transcript:
+    """
+    Return the stored transcript for this exact audio, transcribing only if no
+    earlier upload (or failed attempt) of it produced one with the current settings.
+    Uses short sessions of its own, so no database connection is held while
+    transcribing; the returned row is detached.
+    """
+    params = f"{WHISPER_MODEL}|{transcription_params()}"
+    db = SessionLocal()
+    try:
+        transcript = _find_transcript(db, upload.sha256, params)
+    finally:
+        db.close()
+    if transcript is not None:
+        print(f"Reusing transcript {transcript.id} for {upload.filename}")
+        return transcript
+
+    segments = transcribe_media(upload.path, upload.filename, is_video)
+    db = SessionLocal()
+    try:
+        transcript = models.Transcript(
+            audio_hash=upload.sha256,
+            params=params,
+            segments=json.dumps(segments),
+            segment_count=len(segments)
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Video processing error: {str(e)}")
+        db.add(transcript)
+        try:
+            # Committed straight away so it survives a failure later in the ingest
+            db.commit()
+        except IntegrityError:
+            # The same audio was transcribed concurrently; use that copy
+            db.rollback()
+            return _find_transcript(db, upload.sha256, params)
+        db.refresh(transcript)
+        return transcript
     finally:
-        for path in [tmp_video_path, tmp_audio_path]:
-            if path:
-                try:
-                    os.unlink(path)
-                except Exception:
-                    pass
+        db.close()
+
+
+# Cloudinary rejects single-request uploads above 100 MB; larger files go
+# through upload_large, which sends the file from disk in chunks.
+CLOUDINARY_LARGE_UPLOAD_BYTES = 20 * 1024 * 1024
+
+
+def upload_to_cloudinary(upload: SpooledUpload, **options) -> dict:
+    """Upload a spooled file to Cloudinary straight from disk."""
+    if upload.size > CLOUDINARY_LARGE_UPLOAD_BYTES:
+        return get_cloudinary_uploader().upload_large(upload.path, **options)
+    return get_cloudinary_uploader().upload(upload.path, **options)
+
+
+_storage_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="storage")
+
+
+class StorageUpload:
+    """
+    A Cloudinary upload running concurrently with extraction and embedding.
+    `failed` is set as soon as the upload errors so the other stages can stop early.
+    """
+
+    def __init__(self, upload: SpooledUpload, **options):
+        self.failed = threading.Event()
+        self.future = _storage_executor.submit(upload_to_cloudinary, upload, **options)
+        self.future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            self.failed.set()
+
+    def check(self):
+        if self.failed.is_set():
+            raise IngestCancelled("Storage upload failed")
+
+    def result(self) -> dict:
+        try:
+            return self.future.result()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Cloudinary upload error: {str(e)}")
+
+    def abort(self):
+        """Cancel the upload if it hasn't started, otherwise wait and delete the asset."""
+        if self.future.cancel():
+            return
+        try:
+            result = self.future.result()
+        except Exception:
+            return
+        try:
+            get_cloudinary_uploader().destroy(
+                result.get("public_id"),
+                resource_type=result.get("resource_type", "image")
+            )
+        except Exception as e:
+            print(f"Failed to delete orphaned Cloudinary asset {result.get('public_id')}: {str(e)}")
 
 
 def format_timestamp(seconds: float) -> str:
@@ -286,156 +728,993 @@ def format_timestamp(seconds: float) -> str:
 
 
 
-@router.post("/documents/", response_model=schemas.DocumentResponse)
+def _abort_ingest(db: Session, db_document, storage):
+    """
+    Best-effort cleanup of an ingest that did not finish: stop or undo the
+    Cloudinary upload, drop any upserted vectors and the document row.
+    If the upload itself failed, its error is the one re-raised.
+    """
+    if storage is not None:
+        storage.abort()
+    if db_document is not None and db_document.id:
+        try:
+            get_vector_store().delete(delete_all=True, namespace=f"doc_{db_document.id}")
+            get_vector_store().delete(ids=[f"doc_{db_document.id}"], namespace=routing_namespace(db_document.user_id))
+            if get_lexical_index() is not None:
+                get_lexical_index().delete_document(db_document.id)
+        except Exception:
+            pass
+        try:
+            db.query(models.DocumentChunk).filter(
+                models.DocumentChunk.document_id == db_document.id
+            ).delete()
+            db.delete(db_document)
+            db.commit()
+        except Exception:
+            db.rollback()
+    if storage is not None and storage.failed.is_set():
+        storage.result()
+
+
+def _report_extracted(pages, progress):
+    """Pass pages through, recording when extraction has finished."""
+    yield from pages
+    progress.stage("extracted")
+
+
+def ingest_document(progress, upload: SpooledUpload, title: str, user_id: int) -> dict:
+    """
+    PDF pipeline run on the ingest pool.
+    The Cloudinary upload runs alongside extract → embed → upsert.
+    """
+    filename = upload.filename
+    db = SessionLocal()
+    db_document = None
+    storage = None
+    try:
+        # The document row comes first so vectors can be keyed by its id
+        # while the original file is still uploading.
+        db_document = models.Document(
+            title=title,
+            filename=filename,
+            cloudinary_url="",
+            file_size=upload.size,
+            mime_type="application/pdf",
+            user_id=user_id
+        )
+        db.add(db_document)
+        db.commit()
+        db.refresh(db_document)
+
+        storage = StorageUpload(
+            upload,
+            resource_type="auto",
+            public_id=f"pdf_docs/{str(uuid.uuid4())}",
+            folder="pdf_documents",
+            access_mode="public"
+        )
+
+        # Pages stream from the extractor through the chunker into the embedder
+        progress.stage("extracting")
+        splitter = SimpleTextSplitter(chunk_size=1000, chunk_overlap=200)
+        chunks = splitter.split_pages(_report_extracted(iter_pdf_pages(upload.path), progress))
+        chunk_count = create_vectorstore(chunks, db_document.id, db, progress=progress, cancel=storage.failed)
+
+        progress.stage("uploading")
+        upload_result = storage.result()
+        db_document.cloudinary_url = upload_result.get("secure_url")
+        db_document.public_id = upload_result.get("public_id")
+        db.commit()
+        db.refresh(db_document)
+        progress.set_document(db_document.id)
+
+        return {
+            "id": db_document.id,
+            "title": db_document.title,
+            "filename": db_document.filename,
+            "cloudinary_url": db_document.cloudinary_url,
+            "file_size": db_document.file_size,
+            "mime_type": db_document.mime_type,
+            "chunk_count": chunk_count,
+            "chunks_failed": progress.chunks_failed,
+            "created_at": db_document.created_at
+        }
+
+    except Exception:
+        db.rollback()
+        _abort_ingest(db, db_document, storage)
+        raise
+    finally:
+        db.close()
+        upload.cleanup()
+
+
+def ingest_media(progress, upload: SpooledUpload, title: str, user_id: int) -> dict:
+    """
+    Media pipeline run on the ingest pool.
+    - Audio: transcribed directly with Groq Whisper
+    - Video: audio extracted with ffmpeg, then transcribed
+    The Cloudinary upload runs alongside transcription and embedding.
+    """
+    filename = upload.filename
+    ext = os.path.splitext(filename.lower())[1]
+    is_video = ext in ALLOWED_VIDEO_TYPES
+    mime_type = f"{'video' if is_video else 'audio'}/{ext.lstrip('.')}"
+
+    db = SessionLocal()
+    db_document = None
+    storage = None
+    try:
+        db_document = models.Document(
+            title=title,
+            filename=filename,
+            cloudinary_url="",
+            file_size=upload.size,
+            mime_type=mime_type,
+            user_id=user_id
+        )
+        db.add(db_document)
+        db.commit()
+        db.refresh(db_document)
+
+        # Upload original file to Cloudinary in the background
+        storage = StorageUpload(
+            upload,
+            resource_type="video",
+            public_id=f"media_docs/{str(uuid.uuid4())}",
+            folder="media_documents",
+            access_mode="public"
+        )
+
+        # Transcribe with Groq Whisper (audio extracted from video by ffmpeg),
+        # unless this recording has been transcribed before
+        progress.stage("transcribing")
+        # Transcription can take minutes: give the connection back meanwhile
+        document_id = db_document.id
+        db.close()
+        transcript = load_transcript(upload, is_video)
+        segments = json.loads(transcript.segments)
+        db_document = db.query(models.Document).filter(models.Document.id == document_id).first()
+        if not db_document:
+            raise HTTPException(status_code=404, detail="Document was deleted during transcription")
+        db_document.transcript_id = transcript.id
+        db.commit()
+        storage.check()
+        progress.stage("extracted")
+
+        # Build full transcript text for the job result
+        full_transcript = " ".join([seg["text"] for seg in segments])
+
+        # Embed segments with timestamps into Pinecone
+        chunk_count = create_media_vectorstore(segments, db_document.id, db, progress=progress, cancel=storage.failed)
+
+        progress.stage("uploading")
+        upload_result = storage.result()
+        db_document.cloudinary_url = upload_result.get("secure_url")
+        db_document.public_id = upload_result.get("public_id")
+        db.commit()
+        db.refresh(db_document)
+        progress.set_document(db_document.id)
+
+        return {
+            "id": db_document.id,
+            "title": db_document.title,
+            "filename": db_document.filename,
+            "cloudinary_url": db_document.cloudinary_url,
+            "file_size": db_document.file_size,
+            "mime_type": mime_type,
+            "media_type": "video" if is_video else "audio",
+            "segment_count": len(segments),
+            "chunk_count": chunk_count,
+            "chunks_failed": progress.chunks_failed,
+            "transcript_preview": full_transcript[:300] + "..." if len(full_transcript) > 300 else full_transcript,
+            "created_at": db_document.created_at
+        }
+
+    except Exception:
+        db.rollback()
+        _abort_ingest(db, db_document, storage)
+        raise
+    finally:
+        db.close()
+        upload.cleanup()
+
+
+
+def reingest_document(progress, upload: SpooledUpload, document_id: int) -> dict:
+    """
+    Replace a PDF's content in place, re-embedding only the chunks that changed.
+    The new original is uploaded to Cloudinary alongside; the old asset is
+    removed once everything succeeded.
+    """
+    db = SessionLocal()
+    storage = None
+    try:
+        db_document = db.query(models.Document).filter(models.Document.id == document_id).first()
+        if not db_document:
+            # Deleted between the request being accepted and the job running
+            raise HTTPException(status_code=404, detail="Document not found")
+        old_public_id = db_document.public_id
+
+        storage = StorageUpload(
+            upload,
+            resource_type="auto",
+            public_id=f"pdf_docs/{str(uuid.uuid4())}",
+            folder="pdf_documents",
+            access_mode="public"
+        )
+
+        progress.stage("extracting")
+        splitter = SimpleTextSplitter(chunk_size=1000, chunk_overlap=200)
+        chunks = splitter.split_pages(_report_extracted(iter_pdf_pages(upload.path), progress))
+        diff = update_vectorstore(chunks, document_id, db, progress=progress, cancel=storage.failed)
+
+        progress.stage("uploading")
+        upload_result = storage.result()
+        db_document.filename = upload.filename
+        db_document.file_size = upload.size
+        db_document.cloudinary_url = upload_result.get("secure_url")
+        db_document.public_id = upload_result.get("public_id")
+        db.commit()
+        db.refresh(db_document)
+        progress.set_document(document_id)
+
+        if old_public_id:
+            try:
+                get_cloudinary_uploader().destroy(old_public_id, resource_type="image")
+            except Exception as e:
+                print(f"Failed to delete replaced Cloudinary asset {old_public_id}: {str(e)}")
+
+        return {
+            "id": db_document.id,
+            "title": db_document.title,
+            "filename": db_document.filename,
+            "cloudinary_url": db_document.cloudinary_url,
+            "file_size": db_document.file_size,
+            "mime_type": db_document.mime_type,
+            **diff,
+            "chunks_failed": progress.chunks_failed,
+            "updated_at": db_document.updated_at
+        }
+
+    except Exception:
+        db.rollback()
+        # The document keeps its previous file; vectors that were already
+        # updated will simply be skipped on the next attempt.
+        if storage is not None:
+            storage.abort()
+            if storage.failed.is_set():
+                storage.result()
+        raise
+    finally:
+        db.close()
+        upload.cleanup()
+
+
+
+def reindex_media(progress, document_id: int) -> dict:
+    """Rebuild a media document's vectors from its stored transcript, without re-transcribing."""
+    db = SessionLocal()
+    try:
+        db_document = db.query(models.Document).filter(models.Document.id == document_id).first()
+        if not db_document:
+            raise HTTPException(status_code=404, detail="Document not found")
+        segments = json.loads(db_document.transcript.segments)
+        progress.set_document(document_id)
+        progress.stage("extracted")
+
+        title = db_document.title
+
+        get_vector_store().delete(delete_all=True, namespace=f"doc_{document_id}")
+        db.query(models.DocumentChunk).filter(models.DocumentChunk.document_id == document_id).delete()
+        db.commit()
+        # Embedding takes a while: hold no connection until the windows are written
+        db.close()
+        chunk_count = create_media_vectorstore(segments, document_id, db, progress=progress)
+        # New windows, new context: answers cached for the old ones no longer apply
+        db.query(models.Document).filter(models.Document.id == document_id).update(
+            {models.Document.updated_at: datetime.now(timezone.utc)}
+        )
+        db.commit()
+
+        return {
+            "id": document_id,
+            "title": title,
+            "segment_count": len(segments),
+            "chunk_count": chunk_count,
+            "chunks_failed": progress.chunks_failed
+        }
+    finally:
+        db.close()
+
+
+
+@router.post("/documents/", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
     file: UploadFile = File(...),
     title: Optional[str] = Form(None),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Upload PDF, process it, and store vectors in Pinecone."""
+    """
+    Accept a PDF and queue it for ingestion.
+    Returns a job id immediately; poll GET /jobs/{job_id} for progress.
+    """
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Only PDF files allowed on this endpoint. Use /media/ for audio/video."
         )
 
-    try:
-        file_bytes = await file.read()
-        file_size = len(file_bytes)
-
-        if not title or title.strip() == "":
-            title = file.filename.replace(".pdf", "").replace("_", " ").replace("-", " ")
-
-        public_id = f"pdf_docs/{str(uuid.uuid4())}"
-        upload_result = cloudinary.uploader.upload(
-            file_bytes,
-            resource_type="auto",
-            public_id=public_id,
-            folder="pdf_documents",
-            access_mode="public"
-        )
+    if not title or title.strip() == "":
+        title = file.filename.replace(".pdf", "").replace("_", " ").replace("-", " ")
+
+    upload = await spool_upload(file)
+    job = await run_in_threadpool(create_job, db, current_user.id, "pdf", file.filename)
+    try:
+        submit_job(job.job_id, ingest_document, upload, title, current_user.id)
+    except HTTPException:
+        upload.cleanup()
+        raise
+
+    return job_to_dict(job)
+
+
+
+@router.put("/documents/{document_id}", status_code=status.HTTP_202_ACCEPTED)
+async def replace_document(
+    document_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Upload a new version of an existing PDF.
+    Only chunks whose text changed are re-embedded; returns a job id to poll.
+    """
+    document = await run_in_threadpool(
+        lambda: db.query(models.Document).filter(
+            models.Document.id == document_id,
+            models.Document.user_id == current_user.id
+        ).first()
+    )
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    if document.mime_type != "application/pdf" or not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only PDF documents can be replaced"
+        )
+
+    upload = await spool_upload(file)
+    job = await run_in_threadpool(create_job, db, current_user.id, "pdf_update", file.filename)
+    try:
+        submit_job(job.job_id, reingest_document, upload, document_id)
+    except HTTPException:
+        upload.cleanup()
+        raise
+
+    return job_to_dict(job)
+
+
+
+@router.post("/documents/{document_id}/reindex", status_code=status.HTTP_202_ACCEPTED)
+def reindex_document(
+    document_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Re-chunk and re-embed an audio/video document from its stored transcript.
+    Returns a job id to poll.
+    """
+    document = db.query(models.Document).filter(
+        models.Document.id == document_id,
+        models.Document.user_id == current_user.id
+    ).first()
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    if document.transcript_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No stored transcript for this document; upload it again to index it"
+        )
+
+    job = create_job(db, current_user.id, "media_reindex", document.filename)
+    submit_job(job.job_id, reindex_media, document_id)
+    return job_to_dict(job)
+
+
+
+@router.post("/media/", status_code=status.HTTP_202_ACCEPTED)
+async def upload_media(
+    file: UploadFile = File(...),
+    title: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Accept an audio or video file and queue it for transcription and indexing.
+    Returns a job id immediately; poll GET /jobs/{job_id} for progress.
+    """
+    filename_lower = file.filename.lower()
+    ext = os.path.splitext(filename_lower)[1]
+
+    if ext not in ALLOWED_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported file type '{ext}'. Allowed: {', '.join(sorted(ALLOWED_MEDIA_TYPES))}"
+        )
+
+    if not title or title.strip() == "":
+        title = os.path.splitext(file.filename)[0].replace("_", " ").replace("-", " ")
+
+    upload = await spool_upload(file)
+    job = await run_in_threadpool(create_job, db, current_user.id, "media", file.filename)
+    try:
+        submit_job(job.job_id, ingest_media, upload, title, current_user.id)
+    except HTTPException:
+        upload.cleanup()
+        raise
+
+    return job_to_dict(job)
+
+
+
+def _expand_archive(archive: SpooledUpload) -> List[tuple]:
+    """
+    Spool every member of a zip archive to its own file.
+    Returns (filename, SpooledUpload or None, error) per member. An archive
+    with more than BULK_MAX_FILES members or expanding past
+    BULK_MAX_ARCHIVE_MB is rejected as a whole, with nothing kept.
+    """
+    entries = []
+    try:
+        with zipfile.ZipFile(archive.path) as zf:
+            members = [
+                info for info in zf.infolist()
+                if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+                and os.path.basename(info.filename) and not os.path.basename(info.filename).startswith(".")
+            ]
+            if len(members) > BULK_MAX_FILES:
+                return [(archive.filename, None, f"Archive exceeds the {BULK_MAX_FILES} file limit")]
+            too_large = f"Archive expands past the {BULK_MAX_ARCHIVE_MB} MB limit"
+            budget = BULK_MAX_ARCHIVE_MB * 1024 * 1024
+            # Declared sizes turn away most oversized archives before anything is written;
+            # the budget below also holds when they lie.
+            if sum(info.file_size for info in members) > budget:
+                return [(archive.filename, None, too_large)]
+            for info in members:
+                name = os.path.basename(info.filename)
+                max_bytes = min(MAX_UPLOAD_MB * 1024 * 1024, budget)
+                try:
+                    with zf.open(info) as member:
+                        upload = spool_fileobj(member, name, max_bytes)
+                except HTTPException as e:
+                    if e.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE and max_bytes == budget:
+                        for _, spooled, _ in entries:
+                            if spooled is not None:
+                                spooled.cleanup()
+                        return [(archive.filename, None, too_large)]
+                    entries.append((name, None, e.detail))
+                    continue
+                budget -= upload.size
+                entries.append((name, upload, None))
+    except zipfile.BadZipFile:
+        entries.append((archive.filename, None, "Not a valid zip archive"))
+    finally:
+        archive.cleanup()
+    return entries
+
+
+@router.post("/bulk/", status_code=status.HTTP_202_ACCEPTED)
+async def upload_bulk(
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Upload many PDFs, audio and video files (or .zip archives of them) at once.
+    Each file becomes its own ingest job on the shared bulk pool; the response
+    is a per-file manifest with job ids to poll via GET /jobs/{job_id}.
+    """
+    if len(files) > BULK_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many files, the limit is {BULK_MAX_FILES} per request"
+        )
+
+    entries = []
+    # Spooled files belong to this request until a job takes them over
+    owned = []
+    manifest = []
+    try:
+        for file in files:
+            ext = os.path.splitext(file.filename.lower())[1]
+            try:
+                upload = await spool_upload(file)
+            except HTTPException as e:
+                entries.append((file.filename, None, e.detail))
+                continue
+            if ext in ALLOWED_ARCHIVE_TYPES:
+                members = await run_in_threadpool(_expand_archive, upload)
+                owned.extend(spooled for _, spooled, _ in members if spooled is not None)
+                entries.extend(members)
+            else:
+                owned.append(upload)
+                entries.append((file.filename, upload, None))
+
+        for filename, upload, error in entries:
+            ext = os.path.splitext(filename.lower())[1]
+            if error is None and ext != ".pdf" and ext not in ALLOWED_MEDIA_TYPES:
+                error = f"Unsupported file type '{ext}'"
+            if error is not None:
+                manifest.append({"filename": filename, "status": "rejected", "job_id": None, "error": error})
+                continue
+
+            title = os.path.splitext(filename)[0].replace("_", " ").replace("-", " ")
+            kind, pipeline = ("pdf", ingest_document) if ext == ".pdf" else ("media", ingest_media)
+            job = await run_in_threadpool(create_job, db, current_user.id, kind, filename)
+            try:
+                submit_bulk_job(job.job_id, pipeline, upload, title, current_user.id)
+            except HTTPException as e:
+                manifest.append({"filename": filename, "status": "rejected", "job_id": job.job_id, "error": e.detail})
+                continue
+            owned.remove(upload)
+            manifest.append({"filename": filename, "status": "queued", "job_id": job.job_id, "error": None})
+    finally:
+        for upload in owned:
+            upload.cleanup()
+
+    return {
+        "queued": sum(1 for m in manifest if m["status"] == "queued"),
+        "rejected": sum(1 for m in manifest if m["status"] == "rejected"),
+        "files": manifest
+    }
+
+
+
+@router.get("/jobs/{job_id}")
+def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Report ingestion progress for an upload job."""
+    job = db.query(models.IngestJob).filter(
+        models.IngestJob.job_id == job_id,
+        models.IngestJob.user_id == current_user.id
+    ).first()
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job_to_dict(job)
+
+
+
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+# The exact-term fast path also needs the best BM25 chunk to outscore the
+# runner-up by this factor; otherwise the question goes to vector search.
+LEXICAL_FAST_PATH_MARGIN = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", "1.2"))
+
+
+def lexical_candidates(db: Session, document_id: int, question: str, top_k: int = 3):
+    """
+    (BM25 hits, chunks) for a question. `chunks` is set when the question
+    has exact-match terms (codes, part numbers, quoted phrases) that all
+    occur in the best BM25 chunk, and that chunk clearly outscores the
+    next: those chunks answer it from the lexical index and the chunk
+    store alone, without an embedding call.
+    """
+    lexical_index = get_lexical_index()
+    if lexical_index is None:
+        return [], None
+    lexical = lexical_index.search(document_id, question, HYBRID_CANDIDATES)
+    required = exact_terms(question)
+    decisive = len(lexical) < 2 or lexical[0]["score"] >= LEXICAL_FAST_PATH_MARGIN * lexical[1]["score"]
+    if required and lexical and decisive and all(term in lexical[0]["terms"] for term in required):
+        stored = fetch_by_index(db, document_id, [hit["chunk_index"] for hit in lexical[:top_k]])
+        if lexical[0]["chunk_index"] in stored:
+            return lexical, [stored[hit["chunk_index"]] for hit in lexical[:top_k] if hit["chunk_index"] in stored]
+    return lexical, None
+
+
+def retrieve_chunks(db: Session, document_id: int, question: str, top_k: int = 3,
+                    query_vector: Optional[list] = None, lexical: Optional[List[dict]] = None) -> List[dict]:
+    """
+    Find the chunks of a PDF that best answer a question, as {text, page, ...} dicts.
+    `query_vector` is the question's embedding, if the caller already has it.
+    A caller that already ran lexical_candidates passes its BM25 hits as
+    `lexical`, and the exact-match fast path isn't tried again.
+
+    The BM25 and vector rankings are merged with reciprocal-rank fusion.
+    """
+    if lexical is None:
+        lexical, chunks = lexical_candidates(db, document_id, question, top_k)
+        if chunks is not None:
+            return chunks
+
+    results = get_vector_store().query(
+        vector=query_vector if query_vector is not None else embed_query(question),
+        top_k=HYBRID_CANDIDATES if lexical else top_k,
+        namespace=f"doc_{document_id}",
+        include_metadata=True
+    )
+    if not lexical:
+        return [match["metadata"] for match in hydrate_matches(db, results["matches"][:top_k])]
+
+    by_key = {}
+    vector_ranking = []
+    for match in results["matches"]:
+        index = as_chunk_index(match["metadata"].get("chunk_index"))
+        key = index if index is not None else match["id"]
+        by_key[key] = match
+        vector_ranking.append(key)
+    fused = reciprocal_rank_fusion(vector_ranking, [hit["chunk_index"] for hit in lexical])[:top_k]
+    stored = fetch_by_index(db, document_id, [key for key in fused if isinstance(key, int)])
+    chunks = []
+    for key in fused:
+        if key in stored:
+            chunks.append(stored[key])
+        elif key in by_key:
+            # Indexed before the chunk store: the vector still carries its text
+            chunks.append(hydrate_matches(db, [by_key[key]])[0]["metadata"])
+    return chunks
+
+
+def _lookup_answer(scope: str, question: str):
+    """(cached payload or None, question vector or None) from the answer cache."""
+    answer_cache = get_answer_cache()
+    if answer_cache is None:
+        return None, None
+    return answer_cache.lookup(scope, question, embed_query)
+
+
+def plan_document_answer(db: Session, document: models.Document, question: str, user_id: int) -> dict:
+    """
+    Everything /query/ does before generating: a cache lookup and, on a miss,
+    retrieval and the prompt. See finish_answer for the plan's fields.
+    """
+    # A question close enough to one already answered for this version
+    # of the document gets the stored answer. Repeats are caught before
+    # anything else runs; a question the lexical index answers alone is
+    # never embedded.
+    scope = answer_scope("query", user_id, [document])
+    answer_cache = get_answer_cache()
+    cached = answer_cache.lookup_exact(scope, question) if answer_cache is not None else None
+    plan = {
+        "cached": cached,
+        "prompt": None,
+        "document_id": document.id,
+        "sources": None,
+        "fields": {"document_id": document.id},
+        "cache": None,
+    }
+    if cached is not None:
+        return plan
+
+    query_vector = None
+    lexical, chunks = lexical_candidates(db, document.id, question, top_k=3)
+    if chunks is None:
+        query_vector = embed_query(question)
+        if answer_cache is not None:
+            plan["cached"] = answer_cache.lookup_similar(scope, query_vector)
+            if plan["cached"] is not None:
+                return plan
+        chunks = retrieve_chunks(db, document.id, question, top_k=3, query_vector=query_vector, lexical=lexical)
+    elif answer_cache is not None:
+        answer_cache.miss()
+
+    # Neighbouring chunks fill in answers that cross a chunk boundary
+    spans = expand_context(db, document.id, chunks)
+
+    context = "\n\n".join([span["text"] for span in spans])
+
+    plan["prompt"] = f"""Based on the following context, answer the question.
+If the answer isn't in the context, say "I cannot find the answer in the document."
+
+Context:
+{context}
+
+Question: {question}
+
+Answer:"""
+    plan["cache"] = (scope, query_vector, {})
+    return plan
+
+
+def plan_library_answer(db: Session, all_documents: list, question: str, user_id: int) -> dict:
+    """Everything /query-all/ does before generating (see plan_document_answer)."""
+    doc_map = {doc.id: doc for doc in all_documents}
+
+    # A question close enough to one already answered over this same set
+    # of documents gets the stored answer
+    scope = answer_scope("query-all", user_id, all_documents)
+    cached, query_embedding = _lookup_answer(scope, question)
+    if cached is not None:
+        return {
+            "cached": cached,
+            "prompt": None,
+            "document_id": None,
+            "sources": cached["sources"],
+            "fields": {"document_id": None, "sources": cached["sources"], "partial": False},
+            "cache": None,
+        }
+
+    if query_embedding is None:
+        query_embedding = embed_query(question)
+    candidates = route_query(query_embedding, user_id, all_documents)
+
+    # All namespaces are searched concurrently; whatever misses the deadline is left out
+    matches_by_namespace, failed = query_namespaces(
+        query_embedding, [f"doc_{doc.id}" for doc in candidates], top_k=3
+    )
+
+    all_results = []
+    for doc in candidates:
+        for match in matches_by_namespace.get(f"doc_{doc.id}", []):
+            match["document_title"] = doc.title
+            match["document_id"] = doc.id
+            match["document_filename"] = doc.filename
+            match["mime_type"] = doc.mime_type
+            all_results.append(match)
+
+    if not all_results:
+        raise HTTPException(status_code=404, detail="No relevant content found")
+
+    # Sort by relevance
+    all_results.sort(key=lambda x: x["score"], reverse=True)
+    
+    # Filter by relevance threshold
+    all_results = [r for r in all_results if r["score"] >= 0.4]
+
+    # Deduplicate by document (keep highest score per document)
+    seen_docs = {}
+    deduped_results = []
+    for r in all_results:
+        doc_id = r["document_id"]
+        if doc_id not in seen_docs:
+            seen_docs[doc_id] = True
+            deduped_results.append(r)
+
+    top_results = hydrate_matches(db, deduped_results[:6])
+
+    # Build context with timestamps for media files
+    context_parts = []
+    for i, match in enumerate(top_results, 1):
+        meta = match["metadata"]
+        is_media = match["mime_type"] and not match["mime_type"].startswith("application/pdf")
+        
+        if is_media and "start" in meta:
+            ts = f"[{format_timestamp(meta['start'])} → {format_timestamp(meta['end'])}]"
+            context_parts.append(
+                f"[Source {i}: {match['document_title']}] {ts}\n{meta['text']}"
+            )
+        else:
+            context_parts.append(
+                f"[Source {i}: {match['document_title']}]\n{meta['text']}"
+            )
+    
+    context = "\n\n".join(context_parts)
+
+    prompt = f"""Based on the following context from multiple documents (PDFs, audio, and video),
+answer the question. When answering, refer to sources by their document name.
+For media sources, mention the timestamp where the answer is discussed.
+
+Context:
+{context}
+
+Question: {question}
+
+Answer:"""
+
+    # Build sources list with media timestamps
+    unique_sources = {}
+    for match in top_results:
+        doc_id = match["document_id"]
+        meta = match["metadata"]
+        doc = doc_map[doc_id]
+        is_media = match["mime_type"] and not match["mime_type"].startswith("application/pdf")
+
+        source_entry = {
+            "document_id": doc_id,
+            "document_title": match["document_title"],
+            "filename": match["document_filename"],
+            "relevance_score": float(match["score"]),
+            "mime_type": match["mime_type"],
+            "cloudinary_url": doc.cloudinary_url,
+        }
+
+        # Add timestamp for media files
+        if is_media and "start" in meta:
+            source_entry["timestamp"] = {
+                "start": meta.get("start", 0.0),
+                "end": meta.get("end", 0.0),
+                "display": format_timestamp(meta.get("start", 0.0))
+            }
+        else:
+            source_entry["timestamp"] = None
+
+        if doc_id not in unique_sources or match["score"] > unique_sources[doc_id]["relevance_score"]:
+            unique_sources[doc_id] = source_entry
+
+    sources = sorted(unique_sources.values(), key=lambda x: x["relevance_score"], reverse=True)
+
+    return {
+        "cached": None,
+        "prompt": prompt,
+        "document_id": None,  # Cross-document query
+        "sources": sources,
+        "fields": {"document_id": None, "sources": sources, "partial": bool(failed)},
+        # An answer from a partial search isn't worth reusing
+        "cache": None if failed else (scope, query_embedding, {"sources": sources}),
+    }
+
+
+def plan_media_answer(db: Session, document: models.Document, question: str, user_id: int) -> dict:
+    """Everything /query-media/ does before generating (see plan_document_answer)."""
+    # A question close enough to one already answered for this version
+    # of the recording gets the stored answer and timestamp
+    scope = answer_scope("query-media", user_id, [document])
+    cached, query_embedding = _lookup_answer(scope, question)
+    plan = {
+        "cached": cached,
+        "prompt": None,
+        "document_id": document.id,
+        "sources": None,
+        "fields": {"document_id": document.id, "cloudinary_url": document.cloudinary_url},
+        "cache": None,
+    }
+    if cached is not None:
+        best_start, best_end = cached["start"], cached["end"]
+    else:
+        if query_embedding is None:
+            query_embedding = embed_query(question)
+
+        # Search Pinecone for the most relevant segments
+        results = get_vector_store().query(
+            vector=query_embedding,
+            top_k=4,
+            namespace=f"doc_{document.id}",
+            include_metadata=True
+        )
+
+        if not results["matches"]:
+            raise HTTPException(status_code=404, detail="No relevant content found in this media file.")
 
-        text = extract_text_from_pdf(file_bytes)
+        # Widen the best windows with their neighbours, then sort the spans by
+        # timestamp so context flows chronologically
+        matches = hydrate_matches(db, sorted(results["matches"], key=lambda m: m["score"], reverse=True))
+        spans = expand_context(db, document.id, [m["metadata"] for m in matches])
+        spans.sort(key=lambda meta: meta.get("start", 0))
 
-        db_document = models.Document(
-            title=title,
-            filename=file.filename,
-            cloudinary_url=upload_result.get("secure_url"),
-            public_id=upload_result.get("public_id"),
-            file_size=file_size,
-            mime_type="application/pdf",
-            user_id=current_user.id
-        )
-        db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
+        # Build context with timestamps
+        context_parts = []
+        for meta in spans:
+            start = meta.get("start", 0.0)
+            end = meta.get("end", 0.0)
+            ts = f"[{format_timestamp(start)} → {format_timestamp(end)}]"
+            context_parts.append(f"{ts} {meta['text']}")
 
-        create_vectorstore(text, db_document.id)
+        context = "\n".join(context_parts)
 
-        return db_document
+        plan["prompt"] = f"""You are answering questions about a transcript from an audio/video file.
+Each section of the transcript is prefixed with a timestamp in [MM:SS → MM:SS] format.
 
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
+Based on the transcript below, answer the question.
+If the answer isn't in the transcript, say "I cannot find the answer in this media file."
+Be concise and mention the approximate timestamp where the answer is discussed.
 
+Transcript:
+{context}
 
+Question: {question}
 
-@router.post("/media/")
-async def upload_media(
-    file: UploadFile = File(...),
-    title: Optional[str] = Form(None),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
-):
-    """
-    Upload an audio or video file.
-    - Audio: transcribed directly with Groq Whisper
-    - Video: audio extracted with ffmpeg, then transcribed
-    Transcript segments (with timestamps) are embedded and stored in Pinecone.
-    """
-    filename_lower = file.filename.lower()
-    ext = os.path.splitext(filename_lower)[1]
+Answer:"""
 
-    if ext not in ALLOWED_MEDIA_TYPES:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Unsupported file type '{ext}'. Allowed: {', '.join(sorted(ALLOWED_MEDIA_TYPES))}"
-        )
+        # The best timestamp = the segment of the top-scoring window that matches the question
+        best_start, best_end = locate_in_window(matches[0]["metadata"], question)
+        plan["cache"] = (scope, query_embedding, {"start": best_start, "end": best_end})
 
-    is_video = ext in ALLOWED_VIDEO_TYPES
+    plan["fields"]["timestamp"] = {
+        "start": best_start,
+        "end": best_end,
+        "display": format_timestamp(best_start)
+    }
+    return plan
 
-    try:
-        file_bytes = await file.read()
-        file_size = len(file_bytes)
-
-        if not title or title.strip() == "":
-            title = os.path.splitext(file.filename)[0].replace("_", " ").replace("-", " ")
-
-        # Upload original file to Cloudinary
-        resource_type = "video"
-        public_id = f"media_docs/{str(uuid.uuid4())}"
-        upload_result = cloudinary.uploader.upload(
-            file_bytes,
-            resource_type=resource_type,
-            public_id=public_id,
-            folder="media_documents",
-            access_mode="public"
-        )
-        cloudinary_url = upload_result.get("secure_url")
 
-        # Extract audio from video if needed
-        if is_video:
-            audio_bytes, audio_filename = extract_audio_from_video(file_bytes, file.filename)
-        else:
-            audio_bytes = file_bytes
-            audio_filename = file.filename
+def finish_answer(db: Session, plan: dict, question: str, answer: str, user_id: int) -> dict:
+    """
+    Cache a freshly generated answer, record the query and return the response body.
+
+    A plan (from the plan_*_answer functions) holds:
+    - cached: the answer cache's payload on a hit, else None
+    - prompt: what to generate from on a miss
+    - document_id / sources: what the Query row records
+    - fields: response fields besides id, question, answer, created_at and cached
+    - cache: (scope, question vector, extra payload) to store the answer under, or None
+    """
+    answer_cache = get_answer_cache()
+    if plan["cached"] is None and plan["cache"] is not None and answer_cache is not None:
+        scope, vector, payload = plan["cache"]
+        answer_cache.store(scope, question, vector, {"answer": answer, **payload})
+
+    db_query = models.Query(
+        question=question,
+        answer=answer,
+        document_id=plan["document_id"],
+        user_id=user_id,
+        sources=json.dumps(plan["sources"]) if plan["sources"] is not None else None
+    )
+    db.add(db_query)
+    db.commit()
+    db.refresh(db_query)
 
-        # Transcribe with Groq Whisper
-        segments = transcribe_with_groq(audio_bytes, audio_filename)
+    return {
+        "id": db_query.id,
+        "question": db_query.question,
+        "answer": db_query.answer,
+        **plan["fields"],
+        "created_at": db_query.created_at,
+        "cached": plan["cached"] is not None
+    }
 
-        # Build full transcript text for DB storage
-        full_transcript = " ".join([seg["text"] for seg in segments])
 
-        # Save to DB
-        mime_type = f"{'video' if is_video else 'audio'}/{ext.lstrip('.')}"
-        db_document = models.Document(
-            title=title,
-            filename=file.filename,
-            cloudinary_url=cloudinary_url,
-            public_id=upload_result.get("public_id"),
-            file_size=file_size,
-            mime_type=mime_type,
-            user_id=current_user.id
-        )
-        db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
+def generate_answer(plan: dict) -> str:
+    return plan["cached"]["answer"] if plan["cached"] is not None else groq_generate(plan["prompt"])
 
-        # Embed segments with timestamps into Pinecone
-        segment_count = create_media_vectorstore(segments, db_document.id)
 
-        return {
-            "id": db_document.id,
-            "title": db_document.title,
-            "filename": db_document.filename,
-            "cloudinary_url": cloudinary_url,
-            "file_size": file_size,
-            "mime_type": mime_type,
-            "media_type": "video" if is_video else "audio",
-            "segment_count": segment_count,
-            "transcript_preview": full_transcript[:300] + "..." if len(full_transcript) > 300 else full_transcript,
-            "created_at": db_document.created_at
-        }
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
 
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Media upload error: {str(e)}")
 
+def stream_answer(plan: dict, question: str, user_id: int) -> StreamingResponse:
+    """
+    Server-Sent Events for a planned answer: `token` events ({text}) as Groq
+    produces the answer, then one `done` event with the same body the
+    non-streaming endpoint returns (id, sources, timestamp, cached, ...).
+    A failure mid-stream ends it with an `error` event ({detail}).
+    The query is recorded once the answer is complete.
+    """
+    def events():
+        try:
+            if plan["cached"] is not None:
+                answer = plan["cached"]["answer"]
+                yield _sse("token", {"text": answer})
+            else:
+                parts = []
+                for text in groq_stream(plan["prompt"]):
+                    parts.append(text)
+                    yield _sse("token", {"text": text})
+                answer = "".join(parts).strip()
+
+            # The request's session is closed by the time the stream ends
+            db = SessionLocal()
+            try:
+                body = finish_answer(db, plan, question, answer, user_id)
+            finally:
+                db.close()
+            yield _sse("done", body)
+        except Exception as e:
+            print(f"Streaming answer failed: {str(e)}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.post("/query/", response_model=schemas.QueryResponse)
-async def ask_question(
+def ask_question(
     query: schemas.QueryCreate,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -450,53 +1729,63 @@ async def ask_question(
         raise HTTPException(status_code=404, detail="Document not found")
 
     try:
-        query_result = gemini_client.models.embed_content(
-            model="models/gemini-embedding-001",
-            contents=query.question
-        )
-        query_embedding = query_result.embeddings[0].values
-
-        results = index.query(
-            vector=query_embedding,
-            top_k=3,
-            namespace=f"doc_{query.document_id}",
-            include_metadata=True
-        )
+        plan = plan_document_answer(db, document, query.question, current_user.id)
+        # Give the connection back to the pool while Groq generates
+        db.close()
+        return finish_answer(db, plan, query.question, generate_answer(plan), current_user.id)
 
-        context = "\n\n".join([match["metadata"]["text"] for match in results["matches"]])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
 
-        prompt = f"""Based on the following context, answer the question.
-If the answer isn't in the context, say "I cannot find the answer in the document."
 
-Context:
-{context}
+@router.post("/query/stream")
+def ask_question_stream(
+    query: schemas.QueryCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Like /query/, with the answer streamed as Server-Sent Events (see stream_answer)."""
+    document = db.query(models.Document).filter(
+        models.Document.id == query.document_id,
+        models.Document.user_id == current_user.id
+    ).first()
 
-Question: {query.question}
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
 
-Answer:"""
+    try:
+        plan = plan_document_answer(db, document, query.question, current_user.id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
+    return stream_answer(plan, query.question, current_user.id)
 
-        answer = groq_generate(prompt)
 
-        db_query = models.Query(
-            question=query.question,
-            answer=answer,
-            document_id=query.document_id,
-            user_id=current_user.id
-        )
-        db.add(db_query)
-        db.commit()
-        db.refresh(db_query)
 
-        return db_query
 
+def route_query(query_embedding, user_id: int, documents: list) -> list:
+    """
+    Narrow a library-wide question down to the documents worth searching:
+    the ROUTING_TOP_DOCS closest by centroid, plus any document without one.
+    """
+    routed = [doc for doc in documents if doc.routing_indexed]
+    if len(routed) <= ROUTING_TOP_DOCS:
+        return documents
+    try:
+        results = get_vector_store().query(
+            vector=query_embedding,
+            top_k=ROUTING_TOP_DOCS,
+            namespace=routing_namespace(user_id),
+            include_metadata=True
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
-
-
+        print(f"Document routing failed, searching every document: {str(e)}")
+        return documents
+    chosen = {m["metadata"].get("document_id") for m in results["matches"]}
+    return [doc for doc in documents if doc.id in chosen or not doc.routing_indexed]
 
 
 @router.post("/query-all/")
-async def ask_question_all_documents(
+def ask_question_all_documents(
     question: str = Form(...),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -512,148 +1801,40 @@ async def ask_question_all_documents(
     if not all_documents:
         raise HTTPException(status_code=404, detail="No documents found")
 
-    
-    doc_map = {doc.id: doc for doc in all_documents}
-
     try:
-        # Embed the question
-        query_result = gemini_client.models.embed_content(
-            model="models/gemini-embedding-001",
-            contents=question
-        )
-        query_embedding = query_result.embeddings[0].values
-
-       
-        all_results = []
-        for doc in all_documents:
-            try:
-                results = index.query(
-                    vector=query_embedding,
-                    top_k=3,
-                    namespace=f"doc_{doc.id}",
-                    include_metadata=True
-                )
-                for match in results.get("matches", []):
-                    match["document_title"] = doc.title
-                    match["document_id"] = doc.id
-                    match["document_filename"] = doc.filename
-                    match["mime_type"] = doc.mime_type
-                    all_results.append(match)
-            except Exception:
-                continue
-
-        if not all_results:
-            raise HTTPException(status_code=404, detail="No relevant content found")
-
-        # Sort by relevance
-        all_results.sort(key=lambda x: x["score"], reverse=True)
-        
-        # Filter by relevance threshold
-        all_results = [r for r in all_results if r["score"] >= 0.4]
-
-        # Deduplicate by document (keep highest score per document)
-        seen_docs = {}
-        deduped_results = []
-        for r in all_results:
-            doc_id = r["document_id"]
-            if doc_id not in seen_docs:
-                seen_docs[doc_id] = True
-                deduped_results.append(r)
-
-        top_results = deduped_results[:6]
-
-        # Build context with timestamps for media files
-        context_parts = []
-        for i, match in enumerate(top_results, 1):
-            meta = match["metadata"]
-            is_media = match["mime_type"] and not match["mime_type"].startswith("application/pdf")
-            
-            if is_media and "start" in meta:
-                ts = f"[{format_timestamp(meta['start'])} → {format_timestamp(meta['end'])}]"
-                context_parts.append(
-                    f"[Source {i}: {match['document_title']}] {ts}\n{meta['text']}"
-                )
-            else:
-                context_parts.append(
-                    f"[Source {i}: {match['document_title']}]\n{meta['text']}"
-                )
-        
-        context = "\n\n".join(context_parts)
-
-        # Generate answer with Groq
-        prompt = f"""Based on the following context from multiple documents (PDFs, audio, and video),
-answer the question. When answering, refer to sources by their document name.
-For media sources, mention the timestamp where the answer is discussed.
-
-Context:
-{context}
-
-Question: {question}
-
-Answer:"""
-
-        answer = groq_generate(prompt)
-
-        # Build sources list with media timestamps
-        unique_sources = {}
-        for match in top_results:
-            doc_id = match["document_id"]
-            meta = match["metadata"]
-            doc = doc_map[doc_id]
-            is_media = match["mime_type"] and not match["mime_type"].startswith("application/pdf")
-
-            source_entry = {
-                "document_id": doc_id,
-                "document_title": match["document_title"],
-                "filename": match["document_filename"],
-                "relevance_score": float(match["score"]),
-                "mime_type": match["mime_type"],
-                "cloudinary_url": doc.cloudinary_url,
-            }
-
-            # Add timestamp for media files
-            if is_media and "start" in meta:
-                source_entry["timestamp"] = {
-                    "start": meta.get("start", 0.0),
-                    "end": meta.get("end", 0.0),
-                    "display": format_timestamp(meta.get("start", 0.0))
-                }
-            else:
-                source_entry["timestamp"] = None
+        plan = plan_library_answer(db, all_documents, question, current_user.id)
+        # Give the connection back to the pool while Groq generates
+        db.close()
+        return finish_answer(db, plan, question, generate_answer(plan), current_user.id)
 
-            if doc_id not in unique_sources or match["score"] > unique_sources[doc_id]["relevance_score"]:
-                unique_sources[doc_id] = source_entry
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
 
-        sources = sorted(unique_sources.values(), key=lambda x: x["relevance_score"], reverse=True)
 
-        # Save query to database
-        db_query = models.Query(
-            question=question,
-            answer=answer,
-            document_id=None,  # Cross-document query
-            user_id=current_user.id,
-            sources=json.dumps(sources)
-        )
-        db.add(db_query)
-        db.commit()
-        db.refresh(db_query)
+@router.post("/query-all/stream")
+def ask_question_all_documents_stream(
+    question: str = Form(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Like /query-all/, with the answer streamed as Server-Sent Events (see stream_answer)."""
+    all_documents = db.query(models.Document).filter(
+        models.Document.user_id == current_user.id
+    ).all()
 
-        return {
-            "id": db_query.id,
-            "question": db_query.question,
-            "answer": db_query.answer,
-            "document_id": None,
-            "created_at": db_query.created_at,
-            "sources": sources
-        }
+    if not all_documents:
+        raise HTTPException(status_code=404, detail="No documents found")
 
+    try:
+        plan = plan_library_answer(db, all_documents, question, current_user.id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
+    return stream_answer(plan, question, current_user.id)
 
 
 
 @router.post("/query-media/")
-async def ask_question_media(
+def ask_question_media(
     document_id: int = Form(...),
     question: str = Form(...),
     db: Session = Depends(get_db),
@@ -673,91 +1854,41 @@ async def ask_question_media(
         raise HTTPException(status_code=404, detail="Document not found")
 
     try:
-        # Embed the question
-        query_result = gemini_client.models.embed_content(
-            model="models/gemini-embedding-001",
-            contents=question
-        )
-        query_embedding = query_result.embeddings[0].values
-
-        # Search Pinecone for the most relevant segments
-        results = index.query(
-            vector=query_embedding,
-            top_k=4,
-            namespace=f"doc_{document_id}",
-            include_metadata=True
-        )
-
-        if not results["matches"]:
-            raise HTTPException(status_code=404, detail="No relevant content found in this media file.")
-
-        # Sort matches by timestamp so context flows chronologically
-        matches = sorted(results["matches"], key=lambda m: m["metadata"].get("start", 0))
-
-        # Build context with timestamps
-        context_parts = []
-        for match in matches:
-            meta = match["metadata"]
-            start = meta.get("start", 0.0)
-            end = meta.get("end", 0.0)
-            ts = f"[{format_timestamp(start)} → {format_timestamp(end)}]"
-            context_parts.append(f"{ts} {meta['text']}")
-
-        context = "\n".join(context_parts)
-
-        prompt = f"""You are answering questions about a transcript from an audio/video file.
-Each section of the transcript is prefixed with a timestamp in [MM:SS → MM:SS] format.
-
-Based on the transcript below, answer the question.
-If the answer isn't in the transcript, say "I cannot find the answer in this media file."
-Be concise and mention the approximate timestamp where the answer is discussed.
-
-Transcript:
-{context}
-
-Question: {question}
-
-Answer:"""
+        plan = plan_media_answer(db, document, question, current_user.id)
+        # Give the connection back to the pool while Groq generates
+        db.close()
+        return finish_answer(db, plan, question, generate_answer(plan), current_user.id)
 
-        answer = groq_generate(prompt)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Media query error: {str(e)}")
 
-        # The best timestamp = start of the top-scoring segment
-        top_match = max(results["matches"], key=lambda m: m["score"])
-        best_start = top_match["metadata"].get("start", 0.0)
-        best_end = top_match["metadata"].get("end", 0.0)
 
-        # Save to DB
-        db_query = models.Query(
-            question=question,
-            answer=answer,
-            document_id=document_id,
-            user_id=current_user.id
-        )
-        db.add(db_query)
-        db.commit()
-        db.refresh(db_query)
+@router.post("/query-media/stream")
+def ask_question_media_stream(
+    document_id: int = Form(...),
+    question: str = Form(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Like /query-media/, with the answer streamed as Server-Sent Events (see stream_answer)."""
+    document = db.query(models.Document).filter(
+        models.Document.id == document_id,
+        models.Document.user_id == current_user.id
+    ).first()
 
-        return {
-            "id": db_query.id,
-            "question": question,
-            "answer": answer,
-            "document_id": document_id,
-            "timestamp": {
-                "start": best_start,
-                "end": best_end,
-                "display": format_timestamp(best_start)
-            },
-            "cloudinary_url": document.cloudinary_url,
-            "created_at": db_query.created_at
-        }
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
 
+    try:
+        plan = plan_media_answer(db, document, question, current_user.id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Media query error: {str(e)}")
+    return stream_answer(plan, question, current_user.id)
 
 
 
 @router.post("/summarize/")
-async def summarize_document(
+def summarize_document(
     document_id: int = Form(...),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -776,13 +1907,9 @@ async def summarize_document(
 
     try:
         # Use a generic "summary" embedding query
-        query_result = gemini_client.models.embed_content(
-            model="models/gemini-embedding-001",
-            contents="main topics summary overview key points"
-        )
-        query_embedding = query_result.embeddings[0].values
+        query_embedding = fixed_query_vector(SUMMARY_QUERY)
 
-        results = index.query(
+        results = get_vector_store().query(
             vector=query_embedding,
             top_k=8,
             namespace=f"doc_{document_id}",
@@ -796,7 +1923,7 @@ async def summarize_document(
 
         if is_media:
             # Sort by timestamp for coherent narrative
-            matches = sorted(results["matches"], key=lambda m: m["metadata"].get("start", 0))
+            matches = sorted(hydrate_matches(db, results["matches"]), key=lambda m: m["metadata"].get("start", 0))
             context_parts = []
             for match in matches:
                 meta = match["metadata"]
@@ -814,7 +1941,7 @@ Transcript:
 
 Summary:"""
         else:
-            context = "\n\n".join([m["metadata"]["text"] for m in results["matches"]])
+            context = "\n\n".join([m["metadata"]["text"] for m in hydrate_matches(db, results["matches"])])
             prompt = f"""Summarize the following document content.
 Highlight the main topics and key points.
 Keep it concise (3-5 sentences or bullet points).
@@ -824,6 +1951,8 @@ Content:
 
 Summary:"""
 
+        # Give the connection back to the pool while Groq generates
+        db.close()
         summary = groq_generate(prompt, max_tokens=512)
 
         return {
@@ -839,7 +1968,7 @@ Summary:"""
 
 
 @router.post("/timestamps/")
-async def get_timestamps(
+def get_timestamps(
     document_id: int = Form(...),
     topic: str = Form(...),
     db: Session = Depends(get_db),
@@ -859,13 +1988,9 @@ async def get_timestamps(
         raise HTTPException(status_code=404, detail="Document not found")
 
     try:
-        query_result = gemini_client.models.embed_content(
-            model="models/gemini-embedding-001",
-            contents=topic
-        )
-        query_embedding = query_result.embeddings[0].values
+        query_embedding = embed_query(topic)
 
-        results = index.query(
+        results = get_vector_store().query(
             vector=query_embedding,
             top_k=8,
             namespace=f"doc_{document_id}",
@@ -876,14 +2001,13 @@ async def get_timestamps(
             return {"topic": topic, "timestamps": [], "document_id": document_id}
 
         # Filter by relevance threshold and sort chronologically
-        relevant = [m for m in results["matches"] if m["score"] >= 0.4]
+        relevant = hydrate_matches(db, [m for m in results["matches"] if m["score"] >= 0.4])
         relevant.sort(key=lambda m: m["metadata"].get("start", 0))
 
         timestamps = []
         for match in relevant:
             meta = match["metadata"]
-            start = meta.get("start", 0.0)
-            end = meta.get("end", 0.0)
+            start, end = locate_in_window(meta, topic)
             timestamps.append({
                 "start": start,
                 "end": end,
@@ -906,7 +2030,7 @@ async def get_timestamps(
 
 
 @router.get("/documents/", response_model=List[schemas.DocumentResponse])
-async def list_documents(
+def list_documents(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -919,7 +2043,7 @@ async def list_documents(
 
 
 @router.get("/documents/{document_id}", response_model=schemas.DocumentResponse)
-async def get_document(
+def get_document(
     document_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -936,8 +2060,38 @@ async def get_document(
     return document
 
 
+@router.get("/documents/{document_id}/transcript")
+def get_transcript(
+    document_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Full timestamped transcript of an audio/video document."""
+    document = db.query(models.Document).filter(
+        models.Document.id == document_id,
+        models.Document.user_id == current_user.id
+    ).first()
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    if document.transcript is None:
+        raise HTTPException(status_code=404, detail="No transcript stored for this document")
+
+    segments = json.loads(document.transcript.segments)
+    return {
+        "document_id": document_id,
+        "title": document.title,
+        "segment_count": len(segments),
+        "segments": [
+            {**seg, "display": format_timestamp(seg["start"])}
+            for seg in segments
+        ]
+    }
+
+
 @router.get("/queries/all")
-async def get_all_docs_queries(
+def get_all_docs_queries(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -963,7 +2117,7 @@ async def get_all_docs_queries(
 
 
 @router.get("/queries/{document_id}", response_model=List[schemas.QueryResponse])
-async def get_document_queries(
+def get_document_queries(
     document_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -985,7 +2139,7 @@ async def get_document_queries(
 
 
 @router.post("/sessions/", response_model=dict)
-async def create_session(
+def create_session(
     document_id: int,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -1009,7 +2163,7 @@ async def create_session(
 
 
 @router.post("/sessions/{session_id}/query", response_model=schemas.QueryResponse)
-async def session_query(
+def session_query(
     session_id: str,
     question: str = Form(...),
     db: Session = Depends(get_db),
@@ -1027,9 +2181,9 @@ async def session_query(
     db.commit()
 
     query = schemas.QueryCreate(question=question, document_id=session.document_id)
-    response = await ask_question(query, db)
+    response = ask_question(query, db, current_user)
 
-    db_query = db.query(models.Query).filter(models.Query.id == response.id).first()
+    db_query = db.query(models.Query).filter(models.Query.id == response["id"]).first()
     db_query.session_id = session.id
     db.commit()
 
@@ -1038,11 +2192,36 @@ async def session_query(
 
 
 
+@router.get("/embedding-cache/stats")
+def embedding_cache_stats(
+    current_user: models.User = Depends(get_current_user)
+):
+    """Hit/miss counters and size of the chunk and question embedding caches (this worker)."""
+    embedding_cache = get_embedding_cache()
+    query_cache = get_query_cache()
+    stats = {"enabled": False}
+    if embedding_cache is not None:
+        stats = {"enabled": True, **embedding_cache.stats()}
+    stats["query_cache"] = {"enabled": False} if query_cache is None else {"enabled": True, **query_cache.stats()}
+    return stats
+
+
+@router.get("/answer-cache/stats")
+def answer_cache_stats(
+    current_user: models.User = Depends(get_current_user)
+):
+    """Hit/miss counters and size of the semantic answer cache (this worker)."""
+    answer_cache = get_answer_cache()
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **answer_cache.stats()}
+
+
 @router.get("/test-embedding")
-async def test_embedding():
+def test_embedding():
     """Test Gemini embedding connection."""
     try:
-        result = gemini_client.models.embed_content(
+        result = get_gemini_client().models.embed_content(
             model="models/gemini-embedding-001",
             contents="test text"
         )
@@ -1052,7 +2231,7 @@ async def test_embedding():
 
 
 @router.get("/test-groq")
-async def test_groq():
+def test_groq():
     """Verify Groq connection is working."""
     try:
         answer = groq_generate("Say hello in one sentence.")
@@ -46,6 +46,7 @@ class QueryResponse(QueryBase):
     id: int
     answer: str
     created_at: datetime
+    cached: bool = False  # served from the answer cache
     
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -0,0 +1,53 @@
+# test_chunk_store.py
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database.py builds its engine at import; the tests use their own
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "chunk_store_test.sqlite3"))
+
+import pytest  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import models  # noqa: E402
+from database import Base  # noqa: E402
+from chunk_store import as_chunk_index, expand_context, pack_text  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    for i in range(5):
+        session.add(models.DocumentChunk(
+            document_id=1,
+            chunk_index=i,
+            vector_id=f"doc_1_chunk_{i}",
+            content_hash=str(i),
+            page=i,
+            content=pack_text(f"chunk {i} text")
+        ))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_as_chunk_index_accepts_integral_floats():
+    assert as_chunk_index(3) == 3
+    assert as_chunk_index(3.0) == 3
+    assert as_chunk_index("3") == 3
+    assert as_chunk_index(2.5) is None
+    assert as_chunk_index(None) is None
+    assert as_chunk_index("doc_1_chunk_3") is None
+
+
+def test_expand_context_with_float_chunk_index(db):
+    # Pinecone returns metadata numbers as floats
+    hit = {"document_id": 1.0, "chunk_index": 2.0, "page": 2.0, "text": "chunk 2 text"}
+    spans = expand_context(db, 1, [hit], radius=1, budget=1000)
+    assert len(spans) == 1
+    assert spans[0]["chunk_indices"] == [1, 2, 3]
+    assert spans[0]["text"] == "chunk 1 text\nchunk 2 text\nchunk 3 text"
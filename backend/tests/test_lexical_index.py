@@ -0,0 +1,19 @@
+# test_lexical_index.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import exact_terms  # noqa: E402
+
+
+def test_numbers_and_words_are_not_exact_terms():
+    assert exact_terms("Summarize chapter 3") == []
+    assert exact_terms("What happened in 2024?") == []
+    assert exact_terms("Explain state-of-the-art methods") == []
+
+
+def test_codes_and_quoted_phrases_are_exact_terms():
+    assert exact_terms("What is ERR-4012?") == ["err-4012"]
+    assert exact_terms("Which options does config.yaml take?") == ["config.yaml"]
+    assert exact_terms('What does "warm reboot" mean?') == ["warm", "reboot"]
@@ -0,0 +1,70 @@
+# uploads.py
+import os
+import hashlib
+import tempfile
+
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+
+
+# Uploads are copied to disk in SPOOL_CHUNK_SIZE pieces; nothing downstream
+# holds the whole file in memory. MAX_UPLOAD_MB caps a single file.
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or tempfile.gettempdir()
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "1024"))
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+class SpooledUpload:
+    """An uploaded file copied to local disk, plus its size and content hash."""
+
+    def __init__(self, path: str, filename: str, size: int, sha256: str):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+
+    def cleanup(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_MB * 1024 * 1024) -> SpooledUpload:
+    """spool_fileobj for an UploadFile, run off the event loop."""
+    return await run_in_threadpool(spool_fileobj, file.file, file.filename, max_bytes)
+
+
+def spool_fileobj(fileobj, filename: str, max_bytes: int = MAX_UPLOAD_MB * 1024 * 1024) -> SpooledUpload:
+    """
+    Copy a file-like object (an upload, an archive member) to a temp file
+    chunk by chunk. Raises 413 past max_bytes and 400 for an empty file.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    digest = hashlib.sha256()
+    size = 0
+
+    tmp = tempfile.NamedTemporaryFile(suffix=ext, dir=UPLOAD_SPOOL_DIR, delete=False)
+    try:
+        with tmp:
+            while True:
+                chunk = fileobj.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit"
+                    )
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File content is empty")
+
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+
+    return SpooledUpload(tmp.name, filename, size, digest.hexdigest())
@@ -0,0 +1,487 @@
+# vector_store.py
+import os
+import re
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embeddings import EMBEDDING_DIM
+
+
+# "pinecone" (default) or "local". The local store runs retrieval in-process;
+# it suits single-process deployments, tests and benchmarks.
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone").lower()
+VECTOR_DIMENSION = EMBEDDING_DIM
+PINECONE_INDEX_NAME = "pdf-documents"
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", "./vector_store")
+# Local store only: "float32", or "float16"/"int8" to scan a copy 1/2 or 1/4
+# the size. The full-precision vectors stay on disk; only the top
+# top_k * VECTOR_RESCORE_FACTOR candidates of a quantized scan are read
+# back from them to be re-scored exactly.
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32").lower()
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+# Rows converted to float32 at a time while scanning a quantized matrix,
+# through one reused buffer (1024 x 3072 float32 is 12 MB)
+_SCAN_BLOCK_ROWS = 1024
+
+_COMPACT_TYPES = {"float16": (np.float16, ".f16"), "int8": (np.int8, ".i8")}
+
+
+class VectorStore(ABC):
+    """
+    A namespaced cosine-similarity index.
+
+    Call shapes follow Pinecone's Index so backends are interchangeable.
+    Vectors are {"id", "values", "metadata"} dicts; query() returns
+    {"matches": [{"id", "score", "metadata"}]}, best match first.
+    """
+
+    @abstractmethod
+    def upsert(self, vectors: List[dict], namespace: str):
+        ...
+
+    @abstractmethod
+    def query(self, vector, top_k: int, namespace: str, include_metadata: bool = True) -> dict:
+        ...
+
+    @abstractmethod
+    def update_metadata(self, vector_id: str, metadata: dict, namespace: str):
+        """Merge `metadata` into one vector's metadata, leaving its values as they are."""
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", delete_all: bool = False):
+        ...
+
+    @abstractmethod
+    def list_namespaces(self) -> List[str]:
+        ...
+
+
+def provision_pinecone_index(api_key: str, index_name: str = PINECONE_INDEX_NAME,
+                             dimension: int = VECTOR_DIMENSION, recreate: bool = False):
+    """
+    Create the Pinecone index if it doesn't exist. An index with the wrong
+    dimension is only deleted and recreated (losing its vectors) with `recreate`.
+    """
+    from pinecone import Pinecone, ServerlessSpec
+
+    pc = Pinecone(api_key=api_key)
+
+    if index_name in pc.list_indexes().names():
+        index_info = pc.describe_index(index_name)
+        if index_info.dimension == dimension:
+            print(f"Index {index_name} exists with dimension {dimension}")
+            return
+        if not recreate:
+            raise RuntimeError(
+                f"Index {index_name} has dimension {index_info.dimension}, expected {dimension}; "
+                "rerun with --recreate-index to replace it"
+            )
+        print(f"Deleting old index with dimension {index_info.dimension}")
+        pc.delete_index(index_name)
+        print("Old index deleted")
+
+    pc.create_index(
+        name=index_name,
+        dimension=dimension,
+        metric="cosine",
+        spec=ServerlessSpec(cloud="aws", region="us-east-1")
+    )
+    print(f"New index created with dimension {dimension}")
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    An existing Pinecone serverless index (see provision_pinecone_index).
+    With PINECONE_INDEX_HOST set, connecting needs no describe_index call.
+    """
+
+    def __init__(self, api_key: str, index_name: str = PINECONE_INDEX_NAME, host: Optional[str] = None):
+        # Imported here so the local backend runs without the Pinecone client
+        from pinecone import Pinecone
+
+        pc = Pinecone(api_key=api_key)
+        self._index = pc.Index(host=host) if host else pc.Index(index_name)
+
+    def upsert(self, vectors: List[dict], namespace: str):
+        self._index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector, top_k: int, namespace: str, include_metadata: bool = True) -> dict:
+        results = self._index.query(
+            vector=list(vector),
+            top_k=top_k,
+            namespace=namespace,
+            include_metadata=include_metadata
+        )
+        return {
+            "matches": [
+                {"id": m.id, "score": m.score, "metadata": m.metadata or {}}
+                for m in results.matches
+            ]
+        }
+
+    def update_metadata(self, vector_id: str, metadata: dict, namespace: str):
+        self._index.update(id=vector_id, set_metadata=metadata, namespace=namespace)
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", delete_all: bool = False):
+        if delete_all:
+            self._index.delete(delete_all=True, namespace=namespace)
+        elif ids:
+            self._index.delete(ids=ids, namespace=namespace)
+
+    def list_namespaces(self) -> List[str]:
+        return list(self._index.describe_index_stats().namespaces.keys())
+
+
+class _Matrix:
+    """A memory-mapped 2-D array on disk that grows by doubling."""
+
+    def __init__(self, path: str, dtype, width: int):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.array = None
+        if os.path.exists(path):
+            capacity = os.path.getsize(path) // (width * self.dtype.itemsize)
+            if capacity:
+                self.array = np.memmap(path, dtype=self.dtype, mode="r+", shape=(capacity, width))
+
+    def reserve(self, count: int):
+        capacity = 0 if self.array is None else self.array.shape[0]
+        if count <= capacity:
+            return
+        capacity = max(count, capacity * 2, 256)
+        self.close()
+        open(self.path, "ab").close()
+        os.truncate(self.path, capacity * self.width * self.dtype.itemsize)
+        self.array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.width))
+
+    def flush(self):
+        if self.array is not None:
+            self.array.flush()
+
+    def close(self):
+        self.flush()
+        self.array = None
+
+    def unlink(self):
+        self.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class _Namespace:
+    """
+    Row-ordered ids plus their vectors: an exact float32 matrix and, when
+    quantized, a compact copy (float16, or int8 with a per-row scale) that
+    queries scan. The float32 matrix is then only read a few candidate rows
+    at a time, so it needs disk but little page cache.
+    """
+
+    def __init__(self, base_path: str, dimension: int, ids: List[str], dtype: str):
+        self.ids = ids
+        self.rows = {vector_id: row for row, vector_id in enumerate(ids)}
+        self.quantized = dtype in _COMPACT_TYPES
+        self.scales = None
+        self._buffer = None
+        # Held while reading or changing this namespace's rows
+        self.lock = threading.Lock()
+        self.exact = _Matrix(base_path + ".f32", np.float32, dimension)
+        self.matrix = self.exact
+        if self.quantized:
+            compact_dtype, suffix = _COMPACT_TYPES[dtype]
+            self.matrix = _Matrix(base_path + suffix, compact_dtype, dimension)
+        if dtype == "int8":
+            self.scales = _Matrix(base_path + ".scale", np.float32, 1)
+
+    def _matrices(self):
+        matrices = [self.exact, self.scales]
+        if self.quantized:
+            matrices.append(self.matrix)
+        return [m for m in matrices if m is not None]
+
+    def reserve(self, count: int):
+        for matrix in self._matrices():
+            matrix.reserve(count)
+
+    def write(self, rows: List[int], values: np.ndarray):
+        self.exact.array[rows] = values
+        if self.scales is not None:
+            scale = np.abs(values).max(axis=1, keepdims=True) / 127
+            scale[scale == 0] = 1.0
+            self.matrix.array[rows] = np.round(values / scale).astype(np.int8)
+            self.scales.array[rows] = scale
+        elif self.quantized:
+            self.matrix.array[rows] = values.astype(self.matrix.dtype)
+
+    def move(self, dst: int, src: int):
+        for matrix in self._matrices():
+            matrix.array[dst] = matrix.array[src]
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Dot products of every stored row with the (unit) query."""
+        count = len(self.ids)
+        if not self.quantized:
+            return self.matrix.array[:count] @ query
+        if self._buffer is None:
+            self._buffer = np.empty((_SCAN_BLOCK_ROWS, self.matrix.width), dtype=np.float32)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, _SCAN_BLOCK_ROWS):
+            stop = min(start + _SCAN_BLOCK_ROWS, count)
+            block = self._buffer[:stop - start]
+            np.copyto(block, self.matrix.array[start:stop], casting="unsafe")
+            np.matmul(block, query, out=scores[start:stop])
+        if self.scales is not None:
+            scores *= self.scales.array[:count, 0]
+        return scores
+
+    def rescore(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Exact scores of a few candidate rows, read from the float32 matrix."""
+        return self.exact.array[rows] @ query
+
+    def flush(self):
+        for matrix in self._matrices():
+            matrix.flush()
+
+    def close(self):
+        self._buffer = None
+        for matrix in self._matrices():
+            matrix.close()
+
+    def unlink(self):
+        for matrix in self._matrices():
+            matrix.unlink()
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(values, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return values / norms
+
+
+class Centroid:
+    """Running mean direction of a set of vectors, e.g. all of one document's chunks."""
+
+    def __init__(self):
+        self.total = None
+        self.count = 0
+
+    def add(self, vectors: List[Optional[list]]):
+        vectors = [v for v in vectors if v is not None]
+        if not vectors:
+            return
+        total = _normalize(np.asarray(vectors, dtype=np.float32)).sum(axis=0)
+        self.total = total if self.total is None else self.total + total
+        self.count += len(vectors)
+
+    def vector(self) -> Optional[list]:
+        return None if self.total is None else _normalize(self.total).tolist()
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process cosine index on local disk.
+
+    Each namespace is one memory-mapped float32 file of unit-length vectors,
+    so a query is a single matrix-vector product over the namespace. With
+    `dtype` float16 or int8 the scan runs over a compact copy instead,
+    converted to float32 a block at a time, and the best
+    top_k * VECTOR_RESCORE_FACTOR candidates are re-scored against their
+    float32 rows.
+    Ids, row positions and metadata live in a SQLite file alongside. Deleted
+    rows are filled with the last row, keeping every namespace dense.
+
+    Each namespace has its own lock, so queries against different namespaces
+    scan in parallel; the store-wide lock only covers the namespace map and
+    SQLite. Meant for a single process: row maps are cached in memory and not
+    shared between uvicorn workers.
+    """
+
+    def __init__(self, path: str = LOCAL_VECTOR_STORE_PATH, dimension: int = VECTOR_DIMENSION,
+                 dtype: str = VECTOR_STORE_DTYPE, rescore_factor: int = VECTOR_RESCORE_FACTOR):
+        if dtype != "float32" and dtype not in _COMPACT_TYPES:
+            raise ValueError(f"Unsupported vector store dtype '{dtype}'")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dimension = dimension
+        self.dtype = dtype
+        self.rescore_factor = rescore_factor
+        self._lock = threading.RLock()
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._conn = sqlite3.connect(os.path.join(path, "metadata.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS vectors (
+                   namespace TEXT NOT NULL,
+                   id TEXT NOT NULL,
+                   row INTEGER NOT NULL,
+                   metadata TEXT,
+                   PRIMARY KEY (namespace, id)
+               )"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        self._check_settings()
+
+    def _check_settings(self):
+        # Files written with another dimension or dtype can't be read back
+        wanted = {"dimension": str(self.dimension), "dtype": self.dtype}
+        stored = dict(self._conn.execute("SELECT key, value FROM settings").fetchall())
+        has_vectors = self._conn.execute("SELECT 1 FROM vectors LIMIT 1").fetchone() is not None
+        for key, value in wanted.items():
+            if key in stored and stored[key] != value and has_vectors:
+                raise RuntimeError(
+                    f"Local vector store at {self.path} was built with {key}={stored[key]}, "
+                    f"not {value}; re-index into an empty LOCAL_VECTOR_STORE_PATH"
+                )
+        self._conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", wanted.items())
+        self._conn.commit()
+
+    def _base(self, namespace: str) -> str:
+        return os.path.join(self.path, re.sub(r"[^A-Za-z0-9_.-]", "_", namespace))
+
+    def _load(self, namespace: str) -> _Namespace:
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                rows = self._conn.execute(
+                    "SELECT id FROM vectors WHERE namespace = ? ORDER BY row", (namespace,)
+                ).fetchall()
+                ns = _Namespace(self._base(namespace), self.dimension, [r[0] for r in rows], self.dtype)
+                self._namespaces[namespace] = ns
+            return ns
+
+    @contextmanager
+    def _locked(self, namespace: str):
+        """The loaded namespace, with its lock held (taken before the store lock)."""
+        while True:
+            ns = self._load(namespace)
+            with ns.lock:
+                # Retry if delete_all dropped it while we waited
+                if self._namespaces.get(namespace) is ns:
+                    yield ns
+                    return
+
+    def upsert(self, vectors: List[dict], namespace: str):
+        if not vectors:
+            return
+        values = _normalize(np.asarray([v["values"] for v in vectors], dtype=np.float32))
+        with self._locked(namespace) as ns:
+            rows = []
+            for v in vectors:
+                row = ns.rows.get(v["id"])
+                if row is None:
+                    row = len(ns.ids)
+                    ns.ids.append(v["id"])
+                    ns.rows[v["id"]] = row
+                rows.append(row)
+            ns.reserve(len(ns.ids))
+            ns.write(rows, values)
+            ns.flush()
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO vectors (namespace, id, row, metadata) VALUES (?, ?, ?, ?)",
+                    [(namespace, v["id"], row, json.dumps(v.get("metadata") or {})) for v, row in zip(vectors, rows)]
+                )
+                self._conn.commit()
+
+    def query(self, vector, top_k: int, namespace: str, include_metadata: bool = True) -> dict:
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        with self._locked(namespace) as ns:
+            count = len(ns.ids)
+            if count == 0 or top_k <= 0:
+                return {"matches": []}
+            scores = ns.scores(query)
+            k = min(top_k * self.rescore_factor if ns.quantized else top_k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            if ns.quantized:
+                scores = dict(zip(top.tolist(), ns.rescore(top, query).tolist()))
+                top = np.array(sorted(scores, key=scores.get, reverse=True)[:top_k])
+            else:
+                top = top[np.argsort(-scores[top])]
+            ids = [ns.ids[row] for row in top]
+
+        metadata = {}
+        if include_metadata:
+            with self._lock:
+                placeholders = ",".join("?" * len(ids))
+                metadata = {
+                    vector_id: json.loads(meta)
+                    for vector_id, meta in self._conn.execute(
+                        f"SELECT id, metadata FROM vectors WHERE namespace = ? AND id IN ({placeholders})",
+                        [namespace, *ids]
+                    )
+                }
+
+        return {
+            "matches": [
+                {"id": vector_id, "score": float(scores[row]), "metadata": metadata.get(vector_id, {})}
+                for vector_id, row in zip(ids, top.tolist())
+            ]
+        }
+
+    def update_metadata(self, vector_id: str, metadata: dict, namespace: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata FROM vectors WHERE namespace = ? AND id = ?", (namespace, vector_id)
+            ).fetchone()
+            if row is None:
+                return
+            merged = {**json.loads(row[0] or "{}"), **metadata}
+            self._conn.execute(
+                "UPDATE vectors SET metadata = ? WHERE namespace = ? AND id = ?",
+                (json.dumps(merged), namespace, vector_id)
+            )
+            self._conn.commit()
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", delete_all: bool = False):
+        with self._locked(namespace) as ns:
+            if delete_all:
+                with self._lock:
+                    del self._namespaces[namespace]
+                    ns.unlink()
+                    self._conn.execute("DELETE FROM vectors WHERE namespace = ?", (namespace,))
+                    self._conn.commit()
+                return
+
+            removed = []
+            moved = []
+            for vector_id in ids or []:
+                row = ns.rows.pop(vector_id, None)
+                if row is None:
+                    continue
+                last = len(ns.ids) - 1
+                if row != last:
+                    # Fill the hole with the last row so the matrix stays dense
+                    tail_id = ns.ids[last]
+                    ns.move(row, last)
+                    ns.ids[row] = tail_id
+                    ns.rows[tail_id] = row
+                    moved.append((row, namespace, tail_id))
+                ns.ids.pop()
+                removed.append((namespace, vector_id))
+
+            ns.flush()
+            with self._lock:
+                self._conn.executemany("DELETE FROM vectors WHERE namespace = ? AND id = ?", removed)
+                self._conn.executemany("UPDATE vectors SET row = ? WHERE namespace = ? AND id = ?", moved)
+                self._conn.commit()
+
+    def list_namespaces(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT DISTINCT namespace FROM vectors")]
+
+
+def create_vector_store() -> VectorStore:
+    """Build the backend selected by VECTOR_STORE."""
+    if VECTOR_STORE == "local":
+        print(f"Using local vector store at {LOCAL_VECTOR_STORE_PATH}")
+        return LocalVectorStore()
+    return PineconeVectorStore(os.getenv("PINECONE_API_KEY"), host=os.getenv("PINECONE_INDEX_HOST"))
@@ -24,6 +24,44 @@ api.interceptors.response.use(
 );
 
 
+// POST to a streaming endpoint and read its Server-Sent Events: `token`
+// events carry answer text as it is generated, `done` the full response.
+async function streamAnswer<T>(path: string, body: FormData | object, onToken: (text: string) => void): Promise<T> {
+  const token = localStorage.getItem('token');
+  const headers: Record<string, string> = token ? { Authorization: `Bearer ${token}` } : {};
+  if (!(body instanceof FormData)) headers['Content-Type'] = 'application/json';
+  const response = await fetch(`${API_BASE}${path}`, {
+    method: 'POST',
+    headers,
+    body: body instanceof FormData ? body : JSON.stringify(body),
+  });
+  if (!response.ok || !response.body) {
+    const detail = await response.json().then(d => d.detail).catch(() => response.statusText);
+    throw { response: { status: response.status, data: { detail } } };
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let end;
+    while ((end = buffer.indexOf('\n\n')) !== -1) {
+      const message = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      const event = message.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(message.match(/^data: (.*)$/m)?.[1] ?? 'null');
+      if (event === 'token') onToken(data.text);
+      else if (event === 'done') return data as T;
+      else if (event === 'error') throw { response: { data: { detail: data.detail } } };
+    }
+  }
+  throw { response: { data: { detail: 'Answer stream ended early' } } };
+}
+
+
 function isTokenExpired(token: string): boolean {
   try {
     const payload = JSON.parse(atob(token.split('.')[1]));
@@ -91,6 +129,7 @@ export interface Query {
   answer: string;
   document_id: number | null;
   created_at: string;
+  cached?: boolean;
 }
 
 export interface MediaQueryTimestamp {
@@ -107,6 +146,7 @@ export interface MediaQueryResponse {
   timestamp: MediaQueryTimestamp;
   cloudinary_url: string;
   created_at: string;
+  cached?: boolean;
 }
 
 export interface AllQuerySource {
@@ -126,6 +166,8 @@ export interface AllQueryResponse {
   document_id: null;
   created_at: string;
   sources: AllQuerySource[];
+  partial?: boolean;
+  cached?: boolean;
 }
 
 export interface MediaUploadResponse {
@@ -137,10 +179,30 @@ export interface MediaUploadResponse {
   mime_type: string;
   media_type: 'audio' | 'video';
   segment_count: number;
+  chunk_count: number;
+  chunks_failed: number;
   transcript_preview: string;
   created_at: string;
 }
 
+export interface IngestJob<T = unknown> {
+  job_id: string;
+  kind: 'pdf' | 'media' | 'pdf_update' | 'media_reindex';
+  filename: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  stage: string;
+  progress: {
+    chunks_total: number;
+    chunks_embedded: number;
+    chunks_upserted: number;
+  };
+  document_id: number | null;
+  error: string | null;
+  result: T | null;
+  created_at: string;
+  updated_at: string;
+}
+
 export interface SummaryResponse {
   document_id: number;
   title: string;
@@ -164,6 +226,20 @@ export interface TimestampResponse {
   timestamps: TimestampEntry[];
 }
 
+export interface TranscriptSegment {
+  text: string;
+  start: number;
+  end: number;
+  display: string;
+}
+
+export interface TranscriptResponse {
+  document_id: number;
+  title: string;
+  segment_count: number;
+  segments: TranscriptSegment[];
+}
+
 export interface QueryCreate {
   question: string;
   document_id: number;
@@ -192,18 +268,39 @@ export const documentApi = {
     return data;
   },
 
+  getTranscript: async (id: number): Promise<TranscriptResponse> => {
+    const { data } = await api.get(`/documents/${id}/transcript`);
+    return data;
+  },
+
+  getJob: async <T = unknown>(jobId: string): Promise<IngestJob<T>> => {
+    const { data } = await api.get(`/jobs/${jobId}`);
+    return data;
+  },
+
+  // Uploads are ingested in the background; poll the job until it settles.
+  waitForJob: async <T = unknown>(jobId: string, intervalMs = 1500): Promise<T> => {
+    for (;;) {
+      const job = await documentApi.getJob<T>(jobId);
+      if (job.status === 'completed') return job.result as T;
+      if (job.status === 'failed') throw { response: { data: { detail: job.error || 'Ingestion failed' } } };
+      await new Promise(r => setTimeout(r, intervalMs));
+    }
+  },
+
   uploadDocument: async (formData: FormData): Promise<Document> => {
     const { data } = await api.post('/documents/', formData, {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
-    return data;
+    const result = await documentApi.waitForJob<{ id: number }>(data.job_id);
+    return documentApi.getDocument(result.id);
   },
 
   uploadMedia: async (formData: FormData): Promise<MediaUploadResponse> => {
     const { data } = await api.post('/media/', formData, {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
-    return data;
+    return documentApi.waitForJob<MediaUploadResponse>(data.job_id);
   },
 
   askQuestion: async (query: QueryCreate): Promise<Query> => {
@@ -226,6 +323,22 @@ export const documentApi = {
     return data;
   },
 
+  askQuestionStream: (query: QueryCreate, onToken: (text: string) => void): Promise<Query> =>
+    streamAnswer<Query>('/query/stream', query, onToken),
+
+  askMediaQuestionStream: (documentId: number, question: string, onToken: (text: string) => void): Promise<MediaQueryResponse> => {
+    const fd = new FormData();
+    fd.append('document_id', String(documentId));
+    fd.append('question', question);
+    return streamAnswer<MediaQueryResponse>('/query-media/stream', fd, onToken);
+  },
+
+  askAllDocumentsStream: (question: string, onToken: (text: string) => void): Promise<AllQueryResponse> => {
+    const fd = new FormData();
+    fd.append('question', question);
+    return streamAnswer<AllQueryResponse>('/query-all/stream', fd, onToken);
+  },
+
   getDocumentQueries: async (documentId: number): Promise<Query[]> => {
     const { data } = await api.get(`/queries/${documentId}`);
     return data;